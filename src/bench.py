@@ -0,0 +1,331 @@
+"""
+Print-loop throughput benchmark
+
+Generates synthetic laser jobs and exposes them with the CPython mock of
+the laserhead. The SPI data is handed to a pluggable sink, the time spent
+inflating the job, handling the lines and sending them is reported per
+stage together with the peak memory. Results are stored as JSON so the
+hot path of consecutive commits can be compared.
+
+Usage, from the repository root:
+    uv run bench --facets 2000 --exposures 1 4 --output bench.json
+    uv run bench --baseline bench.json
+
+Sinks:
+    twin  -- the FPGA twin of the mock, with FIFO back-pressure (default)
+    null  -- discards the data, measures the host side alone
+    module:Class -- any class with the interface of ``Sink``
+"""
+
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import logging
+import os
+import platform
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from random import Random
+from unittest import mock
+
+sys.path.append(os.path.dirname(__file__))
+from hexastorm.config import Spi
+
+from control.constants import CONFIG, NVS_STORE
+from control.laserhead import base
+from control.laserhead.base import BaseLaserhead
+from control.laserhead.jobfile import LaserJob, write_job
+
+logger = logging.getLogger(__name__)
+
+
+class Sink:
+    """Receives the SPI data of the print loop.
+
+    Subclasses implement ``write``, the time spent in it is reported as
+    the send stage.
+    """
+
+    def __init__(self, digest=False):
+        self.bytes = 0
+        self.commands = 0
+        self._hash = hashlib.md5() if digest else None
+
+    async def __call__(self, laserhead, command):
+        self.bytes += len(command)
+        self.commands += 1
+        if self._hash is not None:
+            self._hash.update(command)
+        await self.write(laserhead, command)
+
+    async def write(self, laserhead, command):
+        raise NotImplementedError
+
+    @property
+    def digest(self):
+        return None if self._hash is None else self._hash.hexdigest()
+
+
+class NullSink(Sink):
+    async def write(self, laserhead, command):
+        pass
+
+
+class TwinSink(Sink):
+    async def write(self, laserhead, command):
+        await BaseLaserhead.send_command(laserhead, command)
+
+
+SINKS = {"null": NullSink, "twin": TwinSink}
+
+
+def load_sink(name):
+    if name in SINKS:
+        return SINKS[name]
+    module, _, cls = name.partition(":")
+    return getattr(importlib.import_module(module), cls)
+
+
+class Timer:
+    """Accumulates wall-clock and CPU time of a stage."""
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def start(self):
+        return time.perf_counter(), time.process_time()
+
+    def stop(self, started):
+        self.wall += time.perf_counter() - started[0]
+        self.cpu += time.process_time() - started[1]
+
+
+class TimedStream:
+    def __init__(self, stream, timer):
+        self._stream = stream
+        self._timer = timer
+
+    def readinto(self, buf):
+        started = self._timer.start()
+        try:
+            return self._stream.readinto(buf)
+        finally:
+            self._timer.stop(started)
+
+
+def timed_job(timer):
+    """Returns a ``LaserJob`` whose chunks are inflated under ``timer``."""
+
+    class TimedJob(LaserJob):
+        def chunks(self, *args, **kwargs):
+            for stream, size in super().chunks(*args, **kwargs):
+                yield TimedStream(stream, timer), size
+
+    return TimedJob
+
+
+def line_bytes(laserhead):
+    return laserhead.cfg.hdl_cfg.words_scanline * (Spi.command_bytes + Spi.word_bytes)
+
+
+def make_job(path, laserhead, lanes, facets, sparsity, version, seed=0):
+    """Writes a synthetic job, ``sparsity`` of the lines of a lane are blank.
+
+    The blank lines are split over the start and the end of every lane,
+    as in a job whose pattern does not fill its lanes.
+    """
+    size = line_bytes(laserhead)
+    rng = Random(seed)
+    blank = int(facets * sparsity)
+    head = blank // 2
+    lanes_data = []
+    for _ in range(lanes):
+        exposed = bytes(rng.getrandbits(8) | 1 for _ in range((facets - blank) * size))
+        lanes_data.append(bytes(head * size) + exposed + bytes((blank - head) * size))
+    with open(path, "wb") as f:
+        if version >= 2:
+            write_job(f, lanes_data, 5.0, facets, 1, False, bytes(size), 0)
+        else:
+            header = struct.pack("<fII", 5.0, facets, lanes)
+            f.write(zlib.compress(header + b"".join(lanes_data), 9))
+
+
+async def expose(laserhead, fname, sink, timer):
+    async def send_command(command, timeout=0):
+        started = timer.start()
+        try:
+            await sink(laserhead, command)
+        finally:
+            timer.stop(started)
+        return bytearray(len(command))
+
+    laserhead.send_command = send_command
+    await laserhead.print_loop(fname)
+
+
+def run_case(args, case, folder):
+    lanes, facets, exposures, sparsity, version = case
+    fname = f"bench_v{version}_s{int(sparsity * 100)}_e1_nocor.pat"
+    CONFIG["defaultprint"].update(
+        {
+            "exposureperline": exposures,
+            "singlefacet": False,
+            "home_before_print": False,
+            "use_custom_start": False,
+            "skip_blank_lanes": True,
+        }
+    )
+    result = {
+        "name": f"v{version} e{exposures} sparsity {sparsity}",
+        "lanes": lanes,
+        "facets": facets,
+        "exposures": exposures,
+        "sparsity": sparsity,
+        "version": version,
+    }
+    laserhead = BaseLaserhead()
+    make_job(laserhead.get_job_path(fname), laserhead, lanes, facets, sparsity, version)
+    sink_cls = load_sink(args.sink)
+    runs = []
+    for repeat in range(args.repeat + 1):
+        # the last run traces the memory, tracing slows down the others
+        traced = repeat == args.repeat
+        sink = sink_cls(digest=args.digest)
+        decode, send = Timer(), Timer()
+        if traced:
+            tracemalloc.start()
+        started = Timer().start()
+        with mock.patch.object(base, "LaserJob", timed_job(decode)):
+            asyncio.run(expose(laserhead, fname, sink, send))
+        wall = time.perf_counter() - started[0]
+        cpu = time.process_time() - started[1]
+        if traced:
+            result["peak_kib"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            tracemalloc.stop()
+            continue
+        underruns = laserhead.state["job"]["underruns"]
+        runs.append((wall, cpu, decode, send, sink, underruns))
+    if not runs:
+        raise ValueError("At least one timed repeat is needed")
+    # the fastest run has the least interference of the system
+    wall, cpu, decode, send, sink, underruns = min(runs, key=lambda run: run[0])
+    # scanlines of the job, exposures and skipped lines count as one line
+    lines = lanes * facets
+    result.update(
+        {
+            "wall_s": round(wall, 4),
+            "cpu_s": round(cpu, 4),
+            "scanlines": lines,
+            "bytes_sent": sink.bytes,
+            "commands": sink.commands,
+            "lines_per_s": round(lines / wall, 1) if wall else None,
+            "cpu_us_per_line": round(cpu / lines * 1e6, 2) if lines else None,
+            "stages": {
+                "decode_s": round(decode.wall, 4),
+                "send_s": round(send.wall, 4),
+                # line handling of the print loop: patching, copies, checks
+                "copy_cpu_s": round(max(0.0, cpu - decode.cpu - send.cpu), 4),
+            },
+            "underruns": underruns,
+            "digest": sink.digest,
+        }
+    )
+    os.remove(os.path.join(folder, fname))
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {case["name"]: case for case in json.load(f)["cases"]}
+    for case in results["cases"]:
+        old = baseline.get(case["name"])
+        if old is None or not old.get("lines_per_s"):
+            continue
+        change = case["lines_per_s"] / old["lines_per_s"] - 1
+        digest = ""
+        if case["digest"] and old.get("digest") and case["digest"] != old["digest"]:
+            digest = " OUTPUT CHANGED"
+        print(f"{case['name']:<28} {change:+7.1%} lines/s{digest}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the laser print loop.")
+    parser.add_argument("--lanes", type=int, default=4)
+    parser.add_argument("--facets", type=int, default=2000, help="lines per lane")
+    parser.add_argument("--exposures", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--sparsity", type=float, nargs="+", default=[0.0, 0.5])
+    parser.add_argument("--versions", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--sink", default="twin", help="twin, null or module:Class")
+    parser.add_argument(
+        "--speedup",
+        type=float,
+        default=1000.0,
+        help="speed of the FPGA twin relative to real time",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    parser.add_argument("--digest", action="store_true", help="hash the sent data")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+    # underruns are part of the results, not worth a warning per lane
+    logging.getLogger("control").setLevel(logging.ERROR)
+    CONFIG["twin"]["speedup"] = args.speedup
+    # every case starts cold, a standby timer would outlive its event loop
+    CONFIG["laserhead"]["standby_s"] = 0
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sink": args.sink,
+        "speedup": args.speedup,
+        "cases": [],
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        CONFIG["webserver"]["job_folder"] = folder
+        # the checkpoints and coordinates of the runs stay out of src/root
+        base.CHECKPOINT_FILE = os.path.join(folder, "checkpoint.json")
+        NVS_STORE.mock_file = os.path.join(folder, "nvs_mock.json")
+        for version in args.versions:
+            for exposures in args.exposures:
+                for sparsity in args.sparsity:
+                    case = (args.lanes, args.facets, exposures, sparsity, version)
+                    result = run_case(args, case, folder)
+                    results["cases"].append(result)
+                    print(
+                        f"{result['name']:<28} {result['lines_per_s']:>10} lines/s "
+                        f"{result['cpu_us_per_line']:>8} us/line "
+                        f"{result['peak_kib']:>8} KiB"
+                    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,15 @@ if ESP32:
     CONFIG_FILE = "config.json"
     CONFIG_OLD_FILE = "config_old.json"
     NVS_FILE = "nvs_mock.json"  # Unused usually, but keeps variables consistent
+    CHECKPOINT_FILE = "checkpoint.json"
+    QUEUE_FILE = "queue.json"
 else:
     CONFIG_FILE = "src/root/mock_config.json"
     FACTORY_CONFIG_FILE = "src/root/config.json"  # Immutable template
     CONFIG_OLD_FILE = "src/root/mock_config_old.json"
     NVS_FILE = "src/root/nvs_mock.json"
+    CHECKPOINT_FILE = "src/root/checkpoint_mock.json"
+    QUEUE_FILE = "src/root/queue_mock.json"
 
 
 class SafeNVS:
@@ -0,0 +1,201 @@
+"""Job metadata extracted while a job is uploaded.
+
+The header of a laser job is parsed from the first uploaded chunks, the
+metadata of a G-code job is read from its move list once it is compiled.
+The metadata is kept as a small JSON sidecar per job in the ``.meta``
+folder of the job folder, so the file list can show it without opening
+the jobs again.
+"""
+
+import io
+import json
+import logging
+import os
+import struct
+
+from .laserhead import estimate
+from .laserhead.gcodefile import META_FOLDER, OP_HALT, OP_MOVE, Optimizer
+from .laserhead.jobfile import (
+    HEADER_FORMAT,
+    HEADER_SIZE,
+    LANE_SIZE,
+    MAGIC,
+    LaserJob,
+    parse_job_suffix,
+)
+
+logger = logging.getLogger(__name__)
+
+GCODE_EXTENSIONS = (".gcode", ".nc", ".tap")
+# compressed bytes kept of a version 1 job, its header is at the very start
+_HEAD_BYTES = 4096
+
+
+def is_gcode(fname):
+    return fname.lower().endswith(GCODE_EXTENSIONS)
+
+
+class PatScanner:
+    """Parses the header of a laser job from the first uploaded chunks."""
+
+    def __init__(self, fname):
+        self.fname = fname
+        self._head = bytearray()
+
+    def _needed(self):
+        head = self._head
+        if len(head) >= HEADER_SIZE and head[: len(MAGIC)] == MAGIC:
+            lanes = struct.unpack_from(HEADER_FORMAT, head)[4]
+            return HEADER_SIZE + lanes * LANE_SIZE
+        return _HEAD_BYTES
+
+    def feed(self, chunk):
+        offset = 0
+        while offset < len(chunk):
+            missing = self._needed() - len(self._head)
+            if missing <= 0:
+                return
+            self._head.extend(chunk[offset : offset + missing])
+            offset += missing
+
+    def result(self, cfg, singlefacet=False, extents=None):
+        """Returns the metadata of the job, raises ValueError if it is corrupt.
+
+        ``extents`` of the lanes of a version 1 job, as scanned after the
+        upload, are kept in the metadata to skip its blank lanes.
+        """
+        job = LaserJob(io.BytesIO(bytes(self._head)))
+        exposures = job.exposures
+        if exposures is None:
+            exposures = parse_job_suffix(self.fname)[0] or 1
+        scan_axis = cfg.motor_cfg["orth2lsrline"]
+        mm_per_facet = (1.0 / exposures) / cfg.motor_cfg["steps_mm"][scan_axis]
+        # exposed scanlines, version 1 jobs store them only after a scan
+        scanned = None
+        if job.version >= 2:
+            extents = [job.lane_entry(lane)[3:5] for lane in range(job.lanes)]
+        elif extents is not None:
+            scanned = extents
+        else:
+            extents = [(0, job.facets_lane)] * job.lanes
+        lane_length = job.facets_lane * mm_per_facet
+        bbox = None
+        lines = 0
+        for lane, (start, stop) in enumerate(extents):
+            if start >= stop:
+                continue
+            lines += stop - start
+            if lane % 2 == 0:
+                low, high = start * mm_per_facet, stop * mm_per_facet
+            else:
+                low, high = (
+                    lane_length - stop * mm_per_facet,
+                    lane_length - (start * mm_per_facet),
+                )
+            box = [low, lane * job.lane_width, high, (lane + 1) * job.lane_width]
+            bbox = box if bbox is None else _union(bbox, box)
+        meta = {
+            "type": "laser",
+            "version": job.version,
+            "lanes": job.lanes,
+            "facets_lane": job.facets_lane,
+            "lane_width": job.lane_width,
+            "exposures": exposures,
+            "lines": lines,
+            "bbox": _rounded(bbox),
+            "duration": round(
+                sum(
+                    estimate.lane_times(
+                        cfg,
+                        extents,
+                        job.facets_lane,
+                        job.lane_width,
+                        exposures,
+                        singlefacet,
+                    )
+                )
+            ),
+        }
+        if scanned is not None:
+            meta["extents"] = [list(extent) for extent in scanned]
+        return meta
+
+
+def gcode_result(moves, arc_tolerance, merge_tolerance):
+    """Returns the metadata of a G-code job from its compiled move list.
+
+    The moves are resolved from the workspace origin as they would be
+    executed, i.e. with arcs split and collinear moves merged. Execution
+    stops at the first unsupported command, so does the summary and
+    ``halted`` is set.
+    """
+    origin = [0.0, 0.0, 0.0]
+    optimized = Optimizer(
+        moves.moves(origin, arc_tolerance), origin, merge_tolerance, 0
+    )
+    count = 0
+    duration = 0.0
+    low = high = None
+    halted = False
+    for op, target, _, _, move_duration in optimized:
+        if op == OP_HALT:
+            halted = True
+            break
+        if op != OP_MOVE:
+            continue
+        count += 1
+        duration += move_duration
+        if low is None:
+            low, high = list(target), list(target)
+        for idx, value in enumerate(target):
+            low[idx] = min(low[idx], value)
+            high[idx] = max(high[idx], value)
+    return {
+        "type": "gcode",
+        "moves": count,
+        "bbox": None if low is None else _rounded(low[:2] + high[:2]),
+        "z": None if low is None else [round(low[2], 3), round(high[2], 3)],
+        "halted": halted,
+        "duration": round(duration),
+    }
+
+
+def _union(a, b):
+    return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+
+def _rounded(bbox):
+    """Bounding box as ``[xmin, ymin, xmax, ymax]`` in mm."""
+    return None if bbox is None else [round(v, 3) for v in bbox]
+
+
+def meta_path(folder, fname):
+    return f"{folder}/{META_FOLDER}/{fname}.json"
+
+
+def save(folder, fname, meta):
+    try:
+        os.mkdir(f"{folder}/{META_FOLDER}")
+    except OSError:
+        pass  # already exists
+    try:
+        with open(meta_path(folder, fname), "w") as f:
+            json.dump(meta, f)
+    except OSError as e:
+        logger.error(f"Failed to write metadata of {fname}: {e}")
+
+
+def load(folder, fname):
+    """Returns the cached metadata of a job, or None."""
+    try:
+        with open(meta_path(folder, fname)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def remove(folder, fname):
+    try:
+        os.remove(meta_path(folder, fname))
+    except OSError:
+        pass
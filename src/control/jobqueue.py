@@ -0,0 +1,94 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """Persistent queue of laser and G-code jobs executed back to back.
+
+    Every change is written to disk, so queued jobs survive a reboot. The
+    queue does not start by itself after a reboot or a failed job, an
+    operator has to run it.
+
+    A job is a dictionary with an ``id``, the ``file``, whether it is a
+    ``gcode`` job and the print ``settings`` it was queued with.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.jobs = []
+        self.running = False
+        self._next_id = 1
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.jobs = json.load(f)
+        except (OSError, ValueError):
+            self.jobs = []
+        self._next_id = max([job["id"] for job in self.jobs] + [0]) + 1
+
+    def save(self):
+        try:
+            with open(self.path, "w") as f:
+                json.dump(self.jobs, f)
+        except OSError as e:
+            logger.error(f"Failed to write job queue: {e}")
+
+    def add(self, filename, gcode, settings):
+        """Appends a job and returns it."""
+        job = {
+            "id": self._next_id,
+            "file": filename,
+            "gcode": gcode,
+            "settings": settings,
+        }
+        self._next_id += 1
+        self.jobs.append(job)
+        self.save()
+        logger.info(f"Queued {filename} as job {job['id']}.")
+        return job
+
+    def index(self, job_id):
+        """Returns the position of a job in the queue, or None."""
+        for idx, job in enumerate(self.jobs):
+            if job["id"] == job_id:
+                return idx
+        return None
+
+    def cancel(self, job_id):
+        """Removes a job, returns False if it is not queued."""
+        idx = self.index(job_id)
+        if idx is None:
+            return False
+        self.jobs.pop(idx)
+        self.save()
+        return True
+
+    def move(self, job_id, position):
+        """Moves a job to ``position``, returns False if it is not queued."""
+        idx = self.index(job_id)
+        if idx is None:
+            return False
+        position = max(0, min(int(position), len(self.jobs) - 1))
+        self.jobs.insert(position, self.jobs.pop(idx))
+        self.save()
+        return True
+
+    def peek(self):
+        """Returns the next job without removing it, or None."""
+        return self.jobs[0] if self.jobs else None
+
+    def following(self, job_id):
+        """Returns the job queued after ``job_id``, or None."""
+        idx = self.index(job_id)
+        if idx is None or idx + 1 >= len(self.jobs):
+            return None
+        return self.jobs[idx + 1]
+
+    @property
+    def state(self):
+        """Queue summary sent to the UI."""
+        return {"running": self.running, "jobs": self.jobs}
@@ -0,0 +1,81 @@
+"""Chord segmentation of G2/G3 arcs in the XY plane.
+
+An arc is replaced by chords whose sagitta, i.e. the largest distance
+between chord and arc, stays within a tolerance. The chord end points
+are computed at once with numpy on CPython or ulab on MicroPython.
+"""
+
+import math
+
+try:
+    import numpy as np
+
+    NP_FLOAT = float
+except ImportError:
+    from ulab import numpy as np
+
+    NP_FLOAT = np.float
+
+# sweeps below this angle in radians are taken as a full circle
+FULL_CIRCLE_EPS = 1e-9
+# smallest sagitta in mm, a tolerance of zero would need endless chords
+MIN_TOLERANCE = 1e-4
+
+
+def sweep_angle(start, end, center, clockwise):
+    """Returns the signed angle in radians from ``start`` to ``end``.
+
+    Clockwise arcs have a negative sweep. An arc ending at its start is a
+    full circle.
+    """
+    a0 = math.atan2(start[1] - center[1], start[0] - center[0])
+    a1 = math.atan2(end[1] - center[1], end[0] - center[0])
+    sweep = a1 - a0
+    if clockwise:
+        if sweep > -FULL_CIRCLE_EPS:
+            sweep -= 2 * math.pi
+    elif sweep < FULL_CIRCLE_EPS:
+        sweep += 2 * math.pi
+    return sweep
+
+
+def segments(radius, sweep, tolerance):
+    """Returns the number of chords keeping the sagitta within ``tolerance``.
+
+    The tolerance is at least ``MIN_TOLERANCE``, a tolerance reaching the
+    radius gives a single chord.
+    """
+    tolerance = max(tolerance, MIN_TOLERANCE)
+    if radius <= tolerance:
+        return 1
+    step = 2 * math.acos(1 - tolerance / radius)
+    return max(1, math.ceil(abs(sweep) / step))
+
+
+def chords(start, end, offset, clockwise, tolerance):
+    """Returns the end points of the chords of an arc.
+
+    Args:
+        start: start point ``[x, y, z]`` in mm
+        end: end point, z changes linearly for a helix
+        offset: ``(i, j)`` of the center relative to ``start``
+        clockwise: True for G2, False for G3
+        tolerance: allowed sagitta in mm
+
+    The last point equals ``end``. The radius follows from the start
+    point, an end point off the circle is approached by the last chord.
+    """
+    cx = start[0] + offset[0]
+    cy = start[1] + offset[1]
+    radius = math.sqrt(offset[0] ** 2 + offset[1] ** 2)
+    sweep = sweep_angle(start, end, (cx, cy), clockwise)
+    count = segments(radius, sweep, tolerance)
+    a0 = math.atan2(-offset[1], -offset[0])
+    steps = np.arange(1, count + 1, dtype=NP_FLOAT) / count
+    angles = a0 + sweep * steps
+    xs = (cx + radius * np.cos(angles)).tolist()
+    ys = (cy + radius * np.sin(angles)).tolist()
+    zs = (start[2] + (end[2] - start[2]) * steps).tolist()
+    points = [[x, y, z] for x, y, z in zip(xs, ys, zs)]
+    points[-1] = list(end)
+    return points
@@ -1,11 +1,11 @@
 import asyncio
+import gc
+import json
 import logging
-import struct
+import os
 from random import randint
 from time import time
 
-import deflate
-
 try:
     import numpy as np
 
@@ -15,43 +15,45 @@ except ImportError:
 
     NP_FLOAT = np.float
 
+try:
+    from inspect import signature
+except ImportError:  # MicroPython
+    signature = None
+
+try:
+    from time import ticks_diff, ticks_ms, ticks_us
+except ImportError:  # CPython
+    from time import monotonic
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_us():
+        return int(monotonic() * 1000000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+
 from hexastorm.config import PlatformConfig, Spi
 
 from .. import constants
-from ..constants import CONFIG, NVS_STORE
+from ..constants import CHECKPOINT_FILE, CONFIG, NVS_STORE
+from . import gcodefile
+from .estimate import Estimate, lane_times, line_period
+from .jobfile import LaserJob, parse_job_suffix, read_header
+from .metrics import GcMonitor, Metrics
+from .pipeline import ChunkPipeline
+from .planner import Planner
 
 logger = logging.getLogger(__name__)
 
 
-def _parse_job_suffix(fname):
-    """Extract per-line exposure count and optical-correction flag from the job filename.
-
-    Expected filename stem pattern: ``<base>_e<N>_<cor|nocor>``
-    e.g. ``circuit_e1_nocor.pat``  or  ``circuit_e4_cor.pat``
-
-    Returns:
-        (file_exposures: int, optical_correction: bool), or (None, None) if the
-        suffix is absent or malformed.
-    """
-    # Strip path and extension, work with the bare stem
-    stem = fname.rsplit(".", 1)[0].rsplit("/", 1)[-1]
-    parts = stem.split("_")
-    if len(parts) < 3:  # need at least <base> _e<N> _<cor|nocor>
-        return None, None
-    cor_part = parts[-1]
-    exp_part = parts[-2]
-    if cor_part not in ("cor", "nocor"):
-        return None, None
-    if not exp_part.startswith("e"):
-        return None, None
-    try:
-        file_exposures = int(float(exp_part[1:]))
-    except ValueError:
-        return None, None
-    return file_exposures, cor_part == "cor"
-
-
 class BaseLaserhead:
+    # True if moves can be queued while the previous ones run, otherwise
+    # every move ends at a standstill and is planned that way
+    queued_moves = True
+
     def __init__(self):
         self.cfg = PlatformConfig(test=False)  # overwritten by derived classes
 
@@ -59,9 +61,17 @@ class BaseLaserhead:
         self._pause = asyncio.Event()
         self._start = asyncio.Event()
         self.statechange = asyncio.Event()
+        self._standby = None  # timer task while the scan head is kept warm
         self._debug = False
         self._laser_current = 0
         self._enable_steppers = False
+        self.metrics = Metrics()
+        self._gc_monitor = GcMonitor()
+        # buffers of the print loop, kept between jobs, see ``buffer``
+        self._buffers = {}
+        # SPI data of blank lines by bits per scanline, see ``blank_line``
+        self._blank_lines = {}
+        self._line_repetition = None  # probed once, see ``line_repetition``
 
         # Load coodinates from NVS flash database
 
@@ -82,6 +92,25 @@ class BaseLaserhead:
             ],
             dtype=NP_FLOAT,
         )
+        # write-behind journal of the coordinates last committed to NVS
+        self._journal = (self.mpos, self._work_offset.tolist())
+        self._journal_dirty = False
+        self._journal_ticks = ticks_ms()
+
+        # timing model of the FPGA used by the mock methods, not on hardware
+        self._twin = None
+        if not constants.ESP32:
+            from .twin import FPGATwin
+
+            twin_cfg = CONFIG["twin"]
+            self._twin = FPGATwin(
+                self.cfg,
+                spi_hz=twin_cfg["spi_hz"],
+                fifo_words=twin_cfg["fifo_words"],
+                speedup=twin_cfg["speedup"],
+            )
+            self._twin.position = self.mpos
+        self._mock_target_time = 0
 
         self.apply_motor_settings()
         self.reset_state()
@@ -108,20 +137,135 @@ class BaseLaserhead:
         """Returns the full path for a job file in the webserver job folder."""
         return f"{CONFIG['webserver']['job_folder']}/{fname}"
 
-    def _save_position(self):
-        """Saves the current machine coordinates and work offsets directly to NVS."""
-        NVS_STORE.save_state(self.mpos, self._work_offset)
+    def _save_position(self, commit=False):
+        """Journals the current machine coordinates and work offsets.
+
+        An NVS commit writes flash and takes milliseconds, so while a job
+        runs the journal is committed at most every ``position_commit_ms``.
+        Outside a job, motion has stopped once this is called and the
+        coordinates are committed directly.
+        """
+        journal = (self.mpos, self._work_offset.tolist())
+        if journal != self._journal:
+            self._journal = journal
+            self._journal_dirty = True
+        if (
+            commit
+            or not self._state["printing"]
+            or ticks_diff(ticks_ms(), self._journal_ticks)
+            >= CONFIG["laserhead"]["position_commit_ms"]
+        ):
+            self.flush_position()
+
+    def flush_position(self):
+        """Commits the journaled coordinates to NVS if they changed."""
+        if self._journal_dirty:
+            NVS_STORE.save_state(*self._journal)
+            self._journal_dirty = False
+        self._journal_ticks = ticks_ms()
+
+    def load_checkpoint(self):
+        """Returns the checkpoint of an interrupted laser job, or None."""
+        try:
+            with open(CHECKPOINT_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_checkpoint(self, fname, lane, lanes):
+        """Records the next lane to expose, written at lane boundaries.
+
+        The current position is the end of the previous lane, i.e. where the
+        print loop continues with its move to the next lane.
+        """
+        cfg_print = CONFIG["defaultprint"]
+        checkpoint = {
+            "filename": fname,
+            "size": os.stat(self.get_job_path(fname))[6],
+            "lane": lane,
+            "lanes": lanes,
+            "position": self.mpos,
+            "work_offset": self._work_offset.tolist(),
+            "settings": {
+                key: cfg_print[key]
+                for key in (
+                    "laserpower",
+                    "exposureperline",
+                    "singlefacet",
+                    "lanewidth_correction",
+                )
+            },
+        }
+        try:
+            with open(CHECKPOINT_FILE, "w") as f:
+                json.dump(checkpoint, f)
+        except OSError as e:
+            logger.error(f"Failed to write checkpoint: {e}")
+        self._state["checkpoint"] = {"filename": fname, "lane": lane, "lanes": lanes}
+
+    def clear_checkpoint(self):
+        """Removes the checkpoint once a job has completed."""
+        try:
+            os.remove(CHECKPOINT_FILE)
+        except OSError:
+            pass
+        self._state["checkpoint"] = None
+
+    def buffer(self, key, size):
+        """Returns the preallocated buffer ``key`` of ``size`` bytes.
+
+        Buffers are kept between jobs. Allocating them for every job
+        fragments the heap, a large allocation can then fail after a
+        number of jobs.
+        """
+        buf = self._buffers.get(key)
+        if buf is None or len(buf) != size:
+            self._buffers[key] = None
+            self.collect_garbage()
+            buf = self._buffers[key] = bytearray(size)
+        return buf
+
+    def collect_garbage(self):
+        """Collects garbage at a moment it cannot stall the SPI stream.
+
+        The print loop calls it at lane boundaries, while the FIFO exposes
+        the last lines and before the move to the next lane.
+        """
+        start = ticks_us()
+        gc.collect()
+        self.metrics.observe("gc_us", ticks_diff(ticks_us(), start))
+        self.metrics.count("gc_collections")
+        self._gc_monitor.reset()
+
+    def record_underrun(self, lane):
+        """Counts a FIFO underrun and flags the lane it occurred in."""
+        job = self.state["job"]
+        job["underruns"] += 1
+        self.metrics.count("underruns")
+        if lane not in job["underrun_lanes"]:
+            logger.warning(f"FIFO underrun in lane {lane + 1}.")
+            job["underrun_lanes"].append(lane)
 
     def reset_state(self):
         job = {
             "currentline": 0,
             "totallines": 0,
             "printingtime": 0,
+            # planned duration and remaining time in s, None if unknown
+            "estimatedtime": None,
+            "remainingtime": None,
             "exposureperline": 1,
             "singlefacet": False,
             "laserpower": 130,
             "filename": "no file name",
             "workspace_origin": [0.0, 0.0, 0.0],
+            "underruns": 0,
+            "underrun_lanes": [],
+            # garbage collections that interrupted the streaming of a lane
+            "gc_streaming": 0,
+            # G-code commands dropped or merged by the optimizer
+            "removed_commands": 0,
+            "spinup_ms": None,
         }
         job.update(CONFIG["defaultprint"])
         components = {
@@ -130,7 +274,11 @@ class BaseLaserhead:
             "rotating": False,
             "spindle": 0,  # spindle pwm [0-255]
             "fan": 0,  # fan pwm [0-255]
+            "standby": self._standby is not None,
         }
+        checkpoint = self.load_checkpoint()
+        if checkpoint is not None:
+            checkpoint = {key: checkpoint[key] for key in ("filename", "lane", "lanes")}
         state = {
             "printing": False,
             "paused": False,
@@ -138,6 +286,7 @@ class BaseLaserhead:
             "error_message": None,
             "job": job,
             "components": components,
+            "checkpoint": checkpoint,
             "mpos": self.mpos,
             "wpos": self.wpos,
         }
@@ -217,19 +366,53 @@ class BaseLaserhead:
         else:
             target_mpos = self._position + pos_array
 
-        axis_names = ["x", "y", "z"]
-        motors_cfg = CONFIG.get("motors", {})
-        for idx, ax in enumerate(axis_names):
+        lower, upper = self.soft_limits()
+        for idx, ax in enumerate("XYZ"):
             if idx >= len(target_mpos):
                 break
+            val = float(target_mpos[idx])
+            if val < lower[idx]:
+                raise ValueError(f"Target {ax} position ({val:.2f} mm) is below min limit ({lower[idx]:.2f} mm)")
+            if val > upper[idx]:
+                raise ValueError(f"Target {ax} position ({val:.2f} mm) exceeds max limit ({upper[idx]:.2f} mm)")
+
+    def soft_limits(self):
+        """Returns the lower and upper soft limits in mm of the axes.
+
+        The limits are read by ``apply_motor_settings``.
+        """
+        return self._soft_limits
+
+    def _read_soft_limits(self):
+        """Reads the soft limits of ``CONFIG["motors"]``, unset is unbounded."""
+        motors_cfg = CONFIG.get("motors", {})
+        lower = []
+        upper = []
+        for ax in ("x", "y", "z"):
             ax_cfg = motors_cfg.get(ax, {})
             min_limit = ax_cfg.get("min_mm", None)
             max_limit = ax_cfg.get("max_mm", None)
-            val = float(target_mpos[idx])
-            if min_limit is not None and val < float(min_limit):
-                raise ValueError(f"Target {ax.upper()} position ({val:.2f} mm) is below min limit ({min_limit:.2f} mm)")
-            if max_limit is not None and val > float(max_limit):
-                raise ValueError(f"Target {ax.upper()} position ({val:.2f} mm) exceeds max limit ({max_limit:.2f} mm)")
+            lower.append(float("-inf") if min_limit is None else float(min_limit))
+            upper.append(float("inf") if max_limit is None else float(max_limit))
+        return np.array(lower, dtype=NP_FLOAT), np.array(upper, dtype=NP_FLOAT)
+
+    def bounds_error(self, low, high):
+        """Returns why a job spanning ``low`` to ``high`` WPOS does not fit.
+
+        The job is placed at the current work offset, returns None if it
+        stays within the soft limits.
+        """
+        lower, upper = self.soft_limits()
+        low = np.array(low, dtype=NP_FLOAT) + self._work_offset
+        high = np.array(high, dtype=NP_FLOAT) + self._work_offset
+        for idx, ax in enumerate("XYZ"):
+            if low[idx] < lower[idx] or high[idx] > upper[idx]:
+                return (
+                    f"Job {ax} range ({low[idx]:.2f} to {high[idx]:.2f} mm) exceeds "
+                    f"the soft limits ({lower[idx]:.2f} to {upper[idx]:.2f} mm) "
+                    "at the current work offset."
+                )
+        return None
 
     # --- MOCK / PC ASYNC METHODS ---
     # These include simulated delays and call the synchronous helpers above.
@@ -249,13 +432,35 @@ class BaseLaserhead:
                 position, absolute=absolute, workspace=workspace
             )
         logger.info(f"Mock moving to {position} (abs={absolute}, wpos={workspace}).")
-
-        # Simulate physical transit time (Great for UI testing!)
-        await asyncio.sleep(0.3)
+        start = ticks_us()
 
         self._update_coordinates(position, absolute, workspace)
+        # Simulate physical transit time (Great for UI testing!)
+        await asyncio.sleep(self._twin.move(self.mpos, speed))
+        self.metrics.observe("move_us", ticks_diff(ticks_us(), start))
         await self.notify_listeners()
 
+    async def queue_move(self, move):
+        """Queues a planned move, returns once the FPGA accepts it.
+
+        Unlike ``gotopoint`` the move is not waited for, consecutive moves
+        run at the junction speeds of the planner. The target is in machine
+        coordinates and validated by the caller.
+        """
+        start = ticks_us()
+        self._position = np.array(move.target, dtype=NP_FLOAT)
+        self._save_position()
+        wait = self._twin.queue_move(move.target, move.duration)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self.metrics.observe("queue_move_us", ticks_diff(ticks_us(), start))
+
+    async def wait_moves(self):
+        """Waits until the queued moves have finished."""
+        drain = self._twin.drain_time()
+        if drain:
+            await asyncio.sleep(drain)
+
     async def home_axes(self, axes):
         """Mock homing: simulates travel and rests at offset_mm."""
         axis_names = ["x", "y", "z"]
@@ -293,8 +498,45 @@ class BaseLaserhead:
         self.state["printing"] = False
         self.state["paused"] = False
         self.enable_steppers = False
+        self._cancel_standby()
+        self.flush_position()
+        await self.notify_listeners()
+
+    def enter_standby(self, seconds):
+        """Keeps the prism spinning and synchronized for ``seconds``.
+
+        A laser job started in this time skips spin-up, synchronization and
+        the measurement of the facet means.
+        """
+        self._cancel_standby()
+        logger.info(f"Keeping scan head in standby for {seconds} s.")
+        self._standby = asyncio.create_task(self._standby_timeout(seconds))
+        self.state["components"]["standby"] = True
+
+    async def _standby_timeout(self, seconds):
+        await asyncio.sleep(seconds)
+        self._standby = None
+        logger.info("Standby time elapsed, stopping scan head.")
+        self.state["components"]["standby"] = False
+        await self.synchronize(False)
         await self.notify_listeners()
 
+    def _cancel_standby(self):
+        """Cancels the standby timer, returns True if the head was warm."""
+        task = self._standby
+        if task is None:
+            return False
+        self._standby = None
+        task.cancel()
+        self.state["components"]["standby"] = False
+        return True
+
+    async def leave_standby(self):
+        """Stops a scan head kept warm after a job."""
+        if self._cancel_standby():
+            logger.info("Leaving standby, stopping scan head.")
+            await self.synchronize(False)
+
     async def reset_estop(self):
         """Reset emergency stop state and clear errors."""
         logger.info("Resetting E-Stop state...")
@@ -317,11 +559,13 @@ class BaseLaserhead:
         await self.notify_listeners()
 
     async def toggle_laser(self):
+        await self.leave_standby()
         laser = self.state["components"]["laser"]
         self.state["components"]["laser"] = laser = not laser
         logger.info(f"Laser on is {laser}")
 
     async def toggle_prism(self):
+        await self.leave_standby()
         prism = self.state["components"]["rotating"]
         self.state["components"]["rotating"] = prism = not prism
         logger.info(f"Change rotation state prism to {prism}.")
@@ -347,6 +591,7 @@ class BaseLaserhead:
                     if key in settings:
                         # Ensures the FPGA interpolator uses the UI's steps_mm and limits
                         self.cfg.motor_cfg[key][ax_name] = settings[key]
+        self._soft_limits = self._read_soft_limits()
 
         logger.info("Motor settings pushed to TMC and hexastorm layer.")
 
@@ -370,6 +615,7 @@ class BaseLaserhead:
             logger.setLevel(logging.NOTSET)
 
     async def notify_listeners(self):
+        self.metrics.count("notify")
         self.statechange.set()
         # Yield CPU for 1 cycle to let all web clients wake up and process the 'set' state
         await asyncio.sleep(0)
@@ -468,6 +714,51 @@ class BaseLaserhead:
         await self.notify_listeners()
         logger.debug(f"Diode test (Mock) finished. Passed: {report['passed']}")
 
+    async def facet_period(self):
+        """Returns the measured facet period of the prism in ms.
+
+        The mock prism turns at the configured speed at once. Returns None
+        if the period cannot be measured.
+        """
+        return line_period(self.cfg) * 1000
+
+    async def wait_spin_up(self):
+        """Waits until the prism has spun up, returns the time it took in ms.
+
+        Polls the facet period until ``spinup_stable`` consecutive readings
+        differ less than ``spinup_tolerance`` from the previous one. Gives
+        up after ``spinup_timeout_ms``, the former fixed wait, and leaves
+        the verdict to ``synchronize``.
+        """
+        cfg = constants.CONFIG["laserhead"]
+        start = ticks_ms()
+        stable = 0
+        previous = None
+        while stable < cfg["spinup_stable"]:
+            elapsed = ticks_diff(ticks_ms(), start)
+            if elapsed >= cfg["spinup_timeout_ms"]:
+                logger.info(f"Prism not stable after {elapsed} ms, synchronizing.")
+                return elapsed
+            period = await self.facet_period()
+            if (
+                period is not None
+                and previous is not None
+                and abs(period - previous) <= cfg["spinup_tolerance"] * previous
+            ):
+                stable += 1
+            else:
+                stable = 0
+            previous = period
+            await asyncio.sleep(cfg["spinup_poll_ms"] / 1000)
+        elapsed = ticks_diff(ticks_ms(), start)
+        logger.info(f"Prism spun up in {elapsed} ms, facet period {previous:.4f} ms.")
+        return elapsed
+
+    @property
+    def stop_requested(self):
+        """True if the operator stopped the running job."""
+        return self._stop.is_set()
+
     async def handle_pausing_and_stopping(self):
         if self._pause.is_set():
             while self._pause.is_set() and not self._stop.is_set():
@@ -482,66 +773,89 @@ class BaseLaserhead:
 
     async def synchronize(self, value=True):
         logger.debug(f"Mock synchronize: {value}")
+        self._twin.synchronized = value
         return True
 
     async def remap(self, facet_id=0):
         logger.debug(f"Mock remap: facet_id {facet_id} -> 0")
         return 0
 
+    async def _mock_write(self, nbytes):
+        """Writes to the FPGA twin, blocks while its FIFO is full."""
+        # short writes are accumulated to avoid a sleep per command
+        now = time()
+        self._mock_target_time = max(self._mock_target_time, now)
+        self._mock_target_time += self._twin.write(nbytes)
+        ahead = self._mock_target_time - now
+        if ahead > 0.02:
+            await asyncio.sleep(ahead)
+
     async def send_command(self, command, timeout=0):
         if hasattr(command, "__len__") and len(command) > 0:
-            words_scanline = getattr(self.cfg.hdl_cfg, "words_scanline", 1)
-            bytes_command_word = Spi.command_bytes + Spi.word_bytes
-            line_bytes = words_scanline * bytes_command_word
-            n_lines = len(command) // line_bytes
-            if n_lines > 0:
-                rpm = self.cfg.laser_timing["rpm"]
-                facets = self.cfg.laser_timing["facets"]
-                line_time = 60.0 / (
-                    rpm * facets * 5
-                )  # 5 is used to speed up sending the commands.
-                duration = n_lines * line_time
-                now = time()
-                target_time = getattr(self, "_mock_target_time", 0)
-                target_time = max(target_time, now)
-                target_time += duration
-                self._mock_target_time = target_time
-
-                ahead = target_time - now
-                if ahead > 0.02:
-                    await asyncio.sleep(min(0.1, ahead))
+            start = ticks_us()
+            await self._mock_write(len(command))
+            self.metrics.observe("spi_us", ticks_diff(ticks_us(), start))
+            self.metrics.count("bytes_sent", len(command))
         return bytearray(len(command) if hasattr(command, "__len__") else 0)
 
     async def _read_fpga_state(self, data=None):
-        return {
-            "parsing": False,
-            "error": False,
-            "mem_full": False,
-            "mem_empty": True,
-            "photodiode_trigger": False,
-            "synchronized": True,
-        }
+        return self._twin.state()
 
     @property
     def fpga_state(self):
         return self._read_fpga_state()
 
+    @property
+    def line_repetition(self):
+        """True if the FPGA can repeat a scanline for multiple exposures.
+
+        The repetition count is then encoded in the first command word of a
+        line and a line is sent only once. The bitstream has to support it,
+        ``line_repetition`` in the laserhead config enables or disables it.
+        Without that flag it is used if the host accepts ``repetitions`` in
+        ``bit_to_byte_list``, this is checked once.
+        """
+        supported = self._line_repetition
+        if supported is None:
+            supported = constants.CONFIG["laserhead"].get("line_repetition")
+            if supported is None:
+                supported = self._accepts_repetitions()
+            self._line_repetition = bool(supported)
+            logger.info(f"Line repetition supported: {supported}")
+        return self._line_repetition
+
+    def _accepts_repetitions(self):
+        """True if ``bit_to_byte_list`` has a ``repetitions`` argument."""
+        if signature is not None:
+            return "repetitions" in signature(self.bit_to_byte_list).parameters
+        # MicroPython has no inspect, only a rejected keyword means no support
+        bits = int(self.cfg.laser_timing["scanline_length"])
+        try:
+            self.bit_to_byte_list([0] * bits, 1, 0, repetitions=2)
+        except TypeError as e:
+            if "keyword" not in str(e):
+                raise
+            return False
+        return True
+
     async def set_parsing(self, enabled):
         logger.debug(f"Mock set_parsing: {enabled}")
+        self._twin.parsing = enabled
 
     async def write_line(
         self, bit_lst, steps_line=1, direction=0, repetitions=1, facet=None
     ):
-        rpm = self.cfg.laser_timing["rpm"]
-        facets = self.cfg.laser_timing["facets"]
-        line_time = (60.0 / (rpm * facets)) * repetitions
-        await asyncio.sleep(line_time)
-        logger.debug(f"Mock write_line called (slept {line_time:.6f}s)")
+        line_bytes = self.cfg.hdl_cfg.words_scanline * (
+            Spi.command_bytes + Spi.word_bytes
+        )
+        await self._mock_write(line_bytes * repetitions)
+        logger.debug("Mock write_line called")
 
     async def wait_fifo_empty(
         self, poll_interval=0.01, check_sensors=False, timeout=5.0
     ):
-        await asyncio.sleep(0)
+        drain = self._twin.drain_time()
+        await asyncio.sleep(min(timeout, drain) if drain is not None else 0)
         logger.debug("Mock wait_fifo_empty called")
 
     async def enable_comp(
@@ -560,9 +874,13 @@ class BaseLaserhead:
             self.state["components"]["rotating"] = polygon
         if singlefacet is not None:
             self.state["job"]["singlefacet"] = singlefacet
+            if self._twin is not None:
+                self._twin.singlefacet = singlefacet
 
     async def flush_buffer(self):
         logger.info("Flushing buffer")
+        self._twin.reset()
+        self._mock_target_time = 0
 
     def bit_to_byte_list(self, laser_bits, steps_line, direction):
         return [0] * 30
@@ -571,6 +889,30 @@ class BaseLaserhead:
         cmd_len = Spi.command_bytes + Spi.word_bytes
         return [b"\x00" * cmd_len] * 30
 
+    def blank_line(self, bits_scanline=0):
+        """Returns the SPI data of a blank scanline.
+
+        Without bits it is the stop line, which ends the exposure. The data
+        only depends on the configuration and is built once.
+        """
+        line = self._blank_lines.get(bits_scanline)
+        if line is None:
+            line = self._blank_lines[bits_scanline] = b"".join(
+                self.byte_to_cmd_list(
+                    self.bit_to_byte_list([0] * bits_scanline, 1, 0),
+                )
+            )
+        return line
+
+    async def write_blank_lines(self, count=1, bits_scanline=0):
+        """Writes ``count`` blank lines in a single transaction.
+
+        Equivalent to calling ``write_line`` with blank bits ``count``
+        times, by default it writes the stop line.
+        """
+        line = self.blank_line(bits_scanline)
+        await self.send_command(line * count if count > 1 else line, timeout=True)
+
     async def print_loop_prep(self, fname):
         self._stop.clear()
         self._pause.clear()
@@ -579,7 +921,13 @@ class BaseLaserhead:
         self.state["printing"] = True
         self.state["job"]["filename"] = fname
         self.state["job"]["laserpower"] = CONFIG["defaultprint"]["laserpower"]
-        file_exposures, optical_correction = _parse_job_suffix(fname)
+        # version 2 jobs carry exposures and correction in their header
+        header = read_header(self.get_job_path(fname))
+        if header["exposures"] is not None:
+            file_exposures = header["exposures"]
+            optical_correction = header["optical_correction"]
+        else:
+            file_exposures, optical_correction = parse_job_suffix(fname)
         if file_exposures is not None:
             exposures = self.state["job"]["exposureperline"] = file_exposures
         exposures_gui = CONFIG["defaultprint"]["exposureperline"]
@@ -610,18 +958,94 @@ class BaseLaserhead:
         logger.info(basestring)
         return True
 
-    async def print_loop(self, fname):
+    async def job_extents(self, job, fname, bits_scanline, line_bytes):
+        """Returns ``(start, stop)`` of the exposed scanlines of every lane.
+
+        Version 2 jobs store the extents in their lane table. Version 1 jobs
+        are scanned once, at upload, and the extents are kept in the metadata
+        of the job. A job uploaded without them is scanned here and its
+        metadata updated. Returns None if the scan was stopped.
+        """
+        if job.version >= 2:
+            blank_line = self.blank_line(bits_scanline)
+            header_bytes = Spi.command_bytes + Spi.word_bytes
+            return job.extents(line_bytes, blank_line, header_bytes)
+        # imported here, jobinfo imports this package
+        from .. import jobinfo
+
+        folder = CONFIG["webserver"]["job_folder"]
+        meta = jobinfo.load(folder, fname)
+        extents = None if meta is None else meta.get("extents")
+        if extents is not None and len(extents) == job.lanes:
+            return [tuple(extent) for extent in extents]
+        extents = await self.scan_extents(fname, stop=self._stop)
+        if extents is not None and meta is not None:
+            meta["extents"] = extents
+            jobinfo.save(folder, fname, meta)
+        return extents
+
+    async def scan_extents(self, fname, stop=None):
+        """Scans a version 1 job for the extents of its lanes.
+
+        The scan inflates the whole job, it gives way to other tasks after
+        every block and ends early, returning None, once ``stop`` is set.
+        Returns None for later versions, they store their extents.
+        """
+        bits_scanline = int(self.cfg.laser_timing["scanline_length"])
+        line_bytes = self.cfg.hdl_cfg.words_scanline * (
+            Spi.command_bytes + Spi.word_bytes
+        )
+        blank_line = self.blank_line(bits_scanline)
+        header_bytes = Spi.command_bytes + Spi.word_bytes
+        start = ticks_ms()
+        extents = []
+        with open(self.get_job_path(fname), "rb") as f:  # noqa: ASYNC230
+            job = LaserJob(f)
+            if job.version >= 2:
+                return None
+            logger.info(f"Scanning {fname} for blank lanes.")
+            for _ in job.scan(line_bytes, blank_line, header_bytes, extents):
+                await asyncio.sleep(0)
+                if stop is not None and stop.is_set():
+                    return None
+        self.metrics.observe("scan_ms", ticks_diff(ticks_ms(), start))
+        return extents
+
+    async def print_loop(self, fname, resume=False):
+        """Exposes a laser job.
+
+        Args:
+            fname: job file in the job folder
+            resume: continue from the lane stored in the checkpoint of an
+                interrupted exposure of the same job
+        """
         # Light weight reset: Flushes FIFO & resets FPGA fsm state
         await self.flush_buffer()
-        success = await self.print_loop_prep(fname)
-        if not success:
+        metrics = self.metrics
+        if not await self.print_loop_prep(fname):
+            await self.set_error(f"{fname} cannot be exposed with these settings.")
             return
+        start_lane = 0
+        checkpoint = None
+        if resume:
+            checkpoint = self.load_checkpoint()
+            if checkpoint is None or checkpoint["filename"] != fname:
+                await self.set_error(f"No checkpoint available to resume {fname}.")
+                return
+            if checkpoint["size"] != os.stat(self.get_job_path(fname))[6]:
+                await self.set_error(f"{fname} changed since it was interrupted.")
+                return
+            start_lane = checkpoint["lane"]
         await self.notify_listeners()
         await asyncio.sleep(0)
         exposures = self.state["job"]["exposureperline"]
         bits_scanline = int(self.cfg.laser_timing["scanline_length"])
         words_scanline = self.cfg.hdl_cfg.words_scanline
         bytes_command_word = Spi.command_bytes + Spi.word_bytes
+        # the FPGA exposes a line multiple times if the bitstream supports it,
+        # otherwise every exposure is sent separately
+        repeat = exposures > 1 and self.line_repetition
+        kwargs = {"repetitions": exposures} if repeat else {}
         # a laserline instruction is: command + word
         # we read the stored instruction from memory but want to change
         # the command, e.g. steps size after each line
@@ -631,46 +1055,66 @@ class BaseLaserhead:
                 laser_bits=[0] * bits_scanline,
                 steps_line=(1 / exposures),
                 direction=direction,
+                **kwargs,
             )
             cmd_lst = self.byte_to_cmd_list(line)
             commands[direction] = cmd_lst[0]
-
-        with open(self.get_job_path(fname), "rb") as f:  # noqa: SIM117, ASYNC230, in micropython this should be done
-            with deflate.DeflateIO(f, deflate.ZLIB) as d:
-                # Header
-                correction = constants.CONFIG["defaultprint"]["lanewidth_correction"]
-                logger.info(f"Lanewdith correction {correction}.")
-                lane_width = struct.unpack("<f", d.read(4))[0] + correction
-                facets_lane = struct.unpack("<I", d.read(4))[0]
-                lanes = struct.unpack("<I", d.read(4))[0]
-                self.state["job"]["totallines"] = int(facets_lane * lanes)
-                start_time = time()
-                await self.notify_listeners()
-                # z is not homed as it should be already in
-                # position so laser is in focus
-                self.enable_steppers = True
-                laserpower = self.state["job"]["laserpower"]
-                try:
-                    self.laser_current = laserpower
-                except OSError as e:
-                    logger.error(f"Aborting print: {e}")
-                    await self.enable_comp(synchronize=False)
-                    self.enable_steppers = False
-                    self.state["printing"] = False
-                    await self.notify_listeners()
-                    return
-
-                # homing logic
-
-                cfg_print = constants.CONFIG["defaultprint"]
-                # Homing logic
-                if cfg_print["home_before_print"]:
-                    logger.info("Homing X- and Y-axis.")
-                    await self.home_axes([1, 1, 0])
-                else:
-                    logger.info("Skipping homing before print per operator settings.")
-                # Deciding start position
-                custom_origin = cfg_print["workspace_origin"]
+        line_bytes = words_scanline * bytes_command_word
+        resend = exposures > 1 and not repeat
+        if resend:
+            logger.info("Bitstream lacks line repetition, resending exposures.")
+            # preallocated buffer holding all exposures of a single scanline,
+            # reused for every facet to avoid allocations during a lane
+            exposure_buf = self.buffer("exposures", line_bytes * exposures)
+            exposure_mv = memoryview(exposure_buf)
+            first_line = exposure_mv[:line_bytes]
+
+        with open(self.get_job_path(fname), "rb") as f:  # noqa: ASYNC230, in micropython this should be done
+            job = LaserJob(f)
+            # Header
+            correction = constants.CONFIG["defaultprint"]["lanewidth_correction"]
+            logger.info(f"Lanewdith correction {correction}.")
+            lane_width = job.lane_width + correction
+            facets_lane = job.facets_lane
+            lanes = job.lanes
+            self.state["job"]["totallines"] = int(facets_lane * lanes)
+            start_time = time()
+            await self.notify_listeners()
+            # z is not homed as it should be already in
+            # position so laser is in focus
+            self.enable_steppers = True
+            laserpower = self.state["job"]["laserpower"]
+            try:
+                self.laser_current = laserpower
+            except OSError as e:
+                await self.enable_comp(synchronize=False)
+                self.enable_steppers = False
+                await self.set_error(f"Aborting print: {e}")
+                return
+
+            # homing logic
+
+            cfg_print = constants.CONFIG["defaultprint"]
+            # Homing logic
+            if cfg_print["home_before_print"]:
+                logger.info("Homing X- and Y-axis.")
+                await self.home_axes([1, 1, 0])
+            else:
+                logger.info("Skipping homing before print per operator settings.")
+            # Deciding start position
+            custom_origin = cfg_print["workspace_origin"]
+            if checkpoint is not None:
+                self._work_offset = np.array(checkpoint["work_offset"], dtype=NP_FLOAT)
+                logger.info(
+                    f"Resuming at lane {start_lane + 1}, moving to stored MPOS "
+                    f"{checkpoint['position']}."
+                )
+                await self.gotopoint(
+                    checkpoint["position"],
+                    absolute=True,
+                    check_sensors=False,
+                )
+            else:
                 if cfg_print["use_custom_start"] and custom_origin is not None:
                     logger.info(
                         f"Overriding workspace origin to custom MPOS: {custom_origin}"
@@ -687,56 +1131,133 @@ class BaseLaserhead:
                     check_sensors=False,
                 )
 
-                # Ensure FPGA parsing is enabled so component commands take effect
-                await self.set_parsing(True)
+            # blank lanes are found before the prism spins up, a version 1
+            # job is only inflated for it if it was not scanned at upload
+            extents = None
+            if cfg_print.get("skip_blank_lanes", True):
+                extents = await self.job_extents(job, fname, bits_scanline, line_bytes)
 
-                # enable scanhead components including polygon motor
-                await self.enable_comp(
-                    singlefacet=self.state["job"]["singlefacet"],
-                )
-                await asyncio.sleep(2)  # wait for stabilization
+            # Ensure FPGA parsing is enabled so component commands take effect
+            await self.set_parsing(True)
+
+            # a scan head kept warm after the previous job is still spinning
+            # and locked to the photodiode
+            warm = self._cancel_standby() and (await self.fpga_state)["synchronized"]
+
+            # enable scanhead components including polygon motor
+            await self.enable_comp(
+                singlefacet=self.state["job"]["singlefacet"],
+            )
+            if warm:
+                logger.info("Scan head in standby, skipping spin-up and sync.")
+                sync_success = True
+            else:
+                self.state["job"]["spinup_ms"] = await self.wait_spin_up()
 
                 # Synchronize and update facet means
                 sync_success = await self.synchronize(True)
-                if not sync_success:
-                    await self.synchronize(False)
-                    self.enable_steppers = False
-                    await self.set_error(
-                        "Laser synchronization failed: photodiode lock could not be established. Aborting print job."
-                    )
+            if not sync_success:
+                await self.synchronize(False)
+                self.enable_steppers = False
+                await self.set_error(
+                    "Laser synchronization failed: photodiode lock could not be established. Aborting print job."
+                )
 
-                # ensure facet 0 is at the start
-                offset_0 = await self.remap(facet_id=0)
-                # internal facet counter needs to align with calibration table
-                if offset_0 != 0:
-                    logger.info(
-                        f"Rotational offset detected: shifting start by {offset_0} lines."
-                    )
-                    self.enable_steppers = False
-                    dummy_line = [0] * bits_scanline
-                    for _ in range(offset_0):
-                        await self.write_line(dummy_line)
-                    self.enable_steppers = True
-                scan_axis = self.cfg.motor_cfg["orth2lsrline"]
-                axis_idx = ["x", "y", "z"].index(scan_axis)
-                steps_per_mm = self.cfg.motor_cfg["steps_mm"][scan_axis]
-                mm_per_facet = (1.0 / exposures) / steps_per_mm
-
-                for lane in range(lanes):
+            # ensure facet 0 is at the start
+            offset_0 = await self.remap(facet_id=0)
+            # internal facet counter needs to align with calibration table
+            if offset_0 != 0:
+                logger.info(
+                    f"Rotational offset detected: shifting start by {offset_0} lines."
+                )
+                self.enable_steppers = False
+                await self.write_blank_lines(offset_0, bits_scanline)
+                self.enable_steppers = True
+            scan_axis = self.cfg.motor_cfg["orth2lsrline"]
+            axis_idx = ["x", "y", "z"].index(scan_axis)
+            steps_per_mm = self.cfg.motor_cfg["steps_mm"][scan_axis]
+            mm_per_facet = (1.0 / exposures) / steps_per_mm
+
+            # the plan is refined with the measured exposure time
+            single_facet = self.state["job"]["singlefacet"]
+            plan = lane_times(
+                self.cfg,
+                extents or [(0, facets_lane)] * lanes,
+                facets_lane,
+                lane_width,
+                exposures,
+                single_facet,
+            )
+            line_s = exposures * line_period(self.cfg, single_facet)
+            estimate = Estimate(sum(plan[start_lane:]))
+            self.state["job"]["estimatedtime"] = round(estimate.planned)
+            self.state["job"]["remainingtime"] = round(estimate.planned)
+            planned_done = 0.0
+            exposure_start = ticks_ms()
+            lines_chunk = self.cfg.hdl_cfg.lines_chunk
+            # lines per send_command adapt to the FIFO level, between
+            # lines_chunk and the size of an inflated chunk
+            max_lines = lines_chunk * constants.CONFIG["laserhead"]["max_chunk_factor"]
+            send_lines = lines_chunk
+            # decompress the next chunks while the current one is sent
+            chunk_bytes = max_lines * line_bytes
+            pipeline = ChunkPipeline(
+                chunk_bytes,
+                buffers=[self.buffer(key, chunk_bytes) for key in ("ring0", "ring1")],
+            )
+            # start the lanes with a clean heap
+            self.collect_garbage()
+            pipeline.start(job.chunks(max_lines, line_bytes, start_lane, extents))
+            self._save_checkpoint(fname, start_lane, lanes)
+            cancelled = False
+            # progress is reported and stop requests are handled at a fixed
+            # rate, irrespective of the time needed to expose a line
+            progress_ms = constants.CONFIG["laserhead"]["progress_interval_ms"]
+            poll_ms = constants.CONFIG["laserhead"]["fifo_poll_ms"]
+            last_poll = ticks_ms() - poll_ms
+            # first poll of a full FIFO, until it accepts data again
+            blocked_since = None
+            try:
+                for lane in range(start_lane, lanes):
                     if await self.handle_pausing_and_stopping():
-                        await self.write_line([])
+                        # the previous lane ended with a stop line
+                        cancelled = True
                         break
                     self.state["job"]["currentline"] = int(lane * facets_lane)
                     self.state["job"]["printingtime"] = round(time() - start_time)
+                    self.state["job"]["remainingtime"] = estimate.remaining(
+                        planned_done,
+                        ticks_diff(ticks_ms(), exposure_start) / 1000,
+                    )
                     await self.notify_listeners()
+                    last_progress = ticks_ms()
+                    start, stop = extents[lane] if extents else (0, facets_lane)
+                    if start >= stop:
+                        logger.info(f"Skipping blank lane {lane + 1} from {lanes}.")
+                        self._save_checkpoint(fname, lane + 1, lanes)
+                        continue
                     logger.info(f"Exposing lane {lane + 1} from {lanes}.")
-                    if lane > 0:
-                        logger.info("Moving in y-direction for next lane.")
+                    lane_start = ticks_ms()
+                    direction_sign = 1 if (lane % 2 == 0) else -1
+                    # forward lanes start at WPOS 0, backward lanes at the
+                    # end of the scan, blank lines at the start are skipped
+                    lane_origin = 0.0 if lane % 2 == 0 else facets_lane * mm_per_facet
+                    target = self.wpos
+                    target[1] = lane * lane_width
+                    target[axis_idx] = lane_origin + (
+                        direction_sign * start * mm_per_facet
+                    )
+                    if any(abs(a - b) > 1e-6 for a, b in zip(target, self.wpos)):
+                        logger.info(f"Moving to start of lane at WPOS {target}.")
                         await self.gotopoint(
-                            [0, lane_width, 0], absolute=False, check_sensors=False
+                            target,
+                            absolute=True,
+                            workspace=True,
+                            check_sensors=False,
                         )
-                    lane_start_x = float(self._position[axis_idx])
-                    direction_sign = 1 if (lane % 2 == 0) else -1
+                    lane_start_x = float(self._position[axis_idx]) - (
+                        direction_sign * start * mm_per_facet
+                    )
                     if lane % 2 == 1:
                         logger.info("Start exposing backward lane.")
                     else:
@@ -746,75 +1267,128 @@ class BaseLaserhead:
                     if self.state["job"]["singlefacet"]:
                         total_facets = int(total_facets / 4)
 
-                    if exposures == 1:
-                        lines_chunk = self.cfg.hdl_cfg.lines_chunk
-                        for facet in range(0, facets_lane, lines_chunk):
-                            if facet % 1000 == 0:
+                    for facet in range(start, stop, max_lines):
+                        # chunk was inflated while the previous one was sent
+                        waited = ticks_us()
+                        chunk = await pipeline.get()
+                        sending = ticks_us()
+                        metrics.observe("inflate_wait_us", ticks_diff(sending, waited))
+                        metrics.count("bytes_inflated", len(chunk))
+                        # an empty FIFO within a lane means the polygon ran
+                        # out of lines, send more per transaction; a full one
+                        # blocks send_command, send fewer. A state read is
+                        # an SPI transaction, the level is polled at a rate.
+                        fpga = None
+                        if ticks_diff(ticks_ms(), last_poll) >= poll_ms:
+                            last_poll = ticks_ms()
+                            fpga = await self._read_fpga_state()
+                            if fpga["mem_empty"]:
+                                if facet > start:
+                                    self.record_underrun(lane)
+                                send_lines = min(send_lines * 2, max_lines)
+                            elif fpga["mem_full"]:
+                                send_lines = max(send_lines // 2, lines_chunk)
+                                if blocked_since is None:
+                                    blocked_since = ticks_us()
+                        command = commands[0] if lane % 2 == 1 else commands[1]
+                        if resend:
+                            # the exposures of a line are sent in a transaction
+                            send_bytes = line_bytes
+                        else:
+                            if repeat:
+                                # change steps and repetitions of every line
+                                # in place, each line crosses the bus only once
+                                for offset in range(0, len(chunk), line_bytes):
+                                    chunk[offset : offset + bytes_command_word] = (
+                                        command
+                                    )
+                            send_bytes = send_lines * line_bytes
+                        # progress and stop requests are handled between the
+                        # transactions, a chunk can take many line periods
+                        for offset in range(0, len(chunk), send_bytes):
+                            if ticks_diff(ticks_ms(), last_progress) >= progress_ms:
+                                last_progress = ticks_ms()
+                                line = facet + offset // line_bytes
                                 self._position[axis_idx] = lane_start_x + (
-                                    direction_sign * facet * mm_per_facet
+                                    direction_sign * line * mm_per_facet
                                 )
                                 self._save_position()
                                 self.state["job"]["currentline"] = (
-                                    int(lane * facets_lane) + facet
+                                    int(lane * facets_lane) + line
                                 )
                                 self.state["job"]["printingtime"] = round(
                                     time() - start_time
                                 )
-                                await self.notify_listeners()
-                                if await self.handle_pausing_and_stopping():
-                                    await self.set_error("Print job cancelled by user.")
-                                    await self.write_line([])
-                                    break
-                            last_facet = min(facet + lines_chunk, facets_lane)
-                            to_read = last_facet - facet
-                            line_data = d.read(
-                                words_scanline * bytes_command_word * to_read
-                            )
-                            await self.send_command(
-                                line_data,
-                                timeout=True,
-                            )
-                    else:
-                        for facet in range(facets_lane):
-                            if facet % 1000 == 0:
-                                self._position[axis_idx] = lane_start_x + (
-                                    direction_sign * facet * mm_per_facet
-                                )
-                                self._save_position()
-                                self.state["job"]["currentline"] = (
-                                    int(lane * facets_lane) + facet
-                                )
-                                self.state["job"]["printingtime"] = round(
-                                    time() - start_time
+                                # the move to the lane is the first part of it
+                                lane_done = plan[lane] - (stop - line) * line_s
+                                self.state["job"]["remainingtime"] = estimate.remaining(
+                                    planned_done + lane_done,
+                                    ticks_diff(last_progress, exposure_start) / 1000,
                                 )
+                                collections = self._gc_monitor.poll()
+                                if collections:
+                                    self.state["job"]["gc_streaming"] += collections
+                                    metrics.count("gc_streaming", collections)
                                 await self.notify_listeners()
                                 if await self.handle_pausing_and_stopping():
                                     await self.set_error("Print job cancelled by user.")
+                                    await self.write_blank_lines()
+                                    cancelled = True
                                     break
-                            # Read the entire line's data into a buffer
-                            # change number of exposures in first word
-                            line_data = bytearray(
-                                d.read(words_scanline * bytes_command_word)
-                            )
-                            if lane % 2 == 1:
-                                line_data[:bytes_command_word] = commands[0]
+                            if not resend:
+                                # chunks are views into the ring buffers
+                                data = chunk[offset : offset + send_bytes]
                             else:
-                                line_data[:bytes_command_word] = commands[1]
-                            await self.send_command(
-                                list(line_data) * exposures,
-                                timeout=True,
-                            )
+                                # Copy the line into the first exposure slot,
+                                # change number of exposures in first word
+                                first_line[:] = chunk[offset : offset + line_bytes]
+                                exposure_mv[:bytes_command_word] = command
+                                # replicate the patched line into the other slots
+                                for slot in range(
+                                    line_bytes, len(exposure_buf), line_bytes
+                                ):
+                                    exposure_mv[slot : slot + line_bytes] = first_line
+                                data = exposure_buf
+                            await self.send_command(data, timeout=True)
+                            if blocked_since is not None:
+                                # the full FIFO accepted this write
+                                metrics.count(
+                                    "fifo_blocked_us",
+                                    ticks_diff(ticks_us(), blocked_since),
+                                )
+                                blocked_since = None
+                        pipeline.release()
+                        if cancelled:
+                            break
+                    if cancelled:
+                        # the position and checkpoint stay at the lines sent
+                        break
+                    metrics.observe("lane_ms", ticks_diff(ticks_ms(), lane_start))
+                    metrics.count("lines_exposed", stop - start)
                     self._position[axis_idx] = lane_start_x + (
-                        direction_sign * facets_lane * mm_per_facet
+                        direction_sign * stop * mm_per_facet
                     )
                     self._save_position()
-                    await self.write_line([])
+                    await self.write_blank_lines()
+                    # the FIFO still exposes the end of the lane
+                    self.collect_garbage()
+                    planned_done += plan[lane]
+                    self._save_checkpoint(fname, lane + 1, lanes)
+            finally:
+                pipeline.close()
+            if not cancelled:
+                self.clear_checkpoint()
+                self.state["job"]["remainingtime"] = 0
 
         # disable scanhead
         await self.notify_listeners()
         logger.info("Waiting for stopline to execute.")
         await self.wait_fifo_empty()
-        await self.synchronize(False)
+        standby_s = constants.CONFIG["laserhead"]["standby_s"]
+        if standby_s > 0 and not cancelled and not self.state["error_message"]:
+            self.enter_standby(standby_s)
+        else:
+            await self.synchronize(False)
         logger.info("Returning laser head to workspace origin (WPOS 0, 0).")
         current_wpos_z = float(self.wpos[2])
         await self.gotopoint(
@@ -825,6 +1399,7 @@ class BaseLaserhead:
         )
         await self.wait_fifo_empty()
         self.enable_steppers = False
+        self.flush_position()
         if (await self.fpga_state)["error"]:
             logger.info("Error detected during printing")
         logger.info(
@@ -832,3 +1407,171 @@ class BaseLaserhead:
         )
         self.state["printing"] = False
         await self.notify_listeners()
+
+    def motion_planner(self):
+        """Returns a look-ahead planner starting at the current position."""
+        cfg = CONFIG["gcode"]
+        return Planner(
+            cfg["acceleration_mms2"],
+            cfg["junction_deviation_mm"] if self.queued_moves else 0.0,
+            cfg["lookahead"],
+            self.mpos,
+        )
+
+    async def flush_moves(self, planner):
+        """Executes the moves in the look-ahead and waits until they finish.
+
+        A stop discards the moves that were not executed yet.
+        """
+        for move in planner.flush():
+            if self._stop.is_set():
+                break
+            await self.queue_move(move)
+        await self.wait_moves()
+
+    async def execute_gcode(self, fname, keep_spindle=False):
+        """
+        Executes a standard G-code file for 2.5D PCB milling.
+        With keep_spindle, the spindle keeps running for a following job.
+        Supports:
+            G0/G1: Linear motion
+            G2/G3: Arcs in the XY plane with I/J centers
+            G90/G91: Absolute/Relative positioning
+            G21: Millimeters mode (enforced)
+            F: Feedrate (mm/min -> converted to mm/s)
+            M3/M5: Spindle On/Off
+
+        The file is executed from its compiled move list, see
+        ``gcodefile``. Collinear moves are merged and commands without
+        effect dropped, see ``gcodefile.Optimizer``. Moves pass a
+        look-ahead planner and are streamed to the FPGA without waiting
+        for each to finish, if the host can queue moves. Spindle changes
+        wait until the moves before them have finished.
+        """
+        logger.info(f"Starting G-Code execution: {fname}")
+        await self.leave_standby()
+
+        # G-code can omit axes, targets are resolved from the current
+        # WPOS (Workspace Position)
+        gcode_pos = self.wpos
+        work_offset = self._work_offset.tolist()
+        filepath = self.get_job_path(fname)
+        job = self.state["job"]
+        job["filename"] = fname
+        job["printingtime"] = 0
+        started = last_progress = ticks_ms()
+        progress_ms = CONFIG["laserhead"]["progress_interval_ms"]
+        planner = self.motion_planner()
+        arc_tolerance = CONFIG["gcode"]["arc_tolerance_mm"]
+        merge_tolerance = CONFIG["gcode"]["merge_tolerance_mm"]
+        spindle_start = self.state["components"]["spindle"]
+
+        self.state["printing"] = True
+        await self.notify_listeners()
+
+        record = 0
+        try:
+            with gcodefile.load(filepath) as moves:
+                # plan the job from the move lengths and feedrates, the
+                # optimized moves depend on the start position and are
+                # streamed again from the move list to execute them
+                planned = 0.0
+                low = high = None
+                optimized = gcodefile.Optimizer(
+                    moves.moves(gcode_pos, arc_tolerance),
+                    gcode_pos,
+                    merge_tolerance,
+                    spindle_start,
+                )
+                for op, target, _, _, duration in optimized:
+                    planned += duration
+                    if op != gcodefile.OP_MOVE:
+                        continue
+                    if low is None:
+                        low, high = list(target), list(target)
+                    for idx, value in enumerate(target):
+                        if value < low[idx]:
+                            low[idx] = value
+                        elif value > high[idx]:
+                            high[idx] = value
+                # the whole job has to fit, it is rejected before any move
+                # instead of halting halfway
+                error = None if low is None else self.bounds_error(low, high)
+                if self.state["estop"]:
+                    error = "Machine is locked in E-STOP state! Reset machine first."
+                if error is not None:
+                    await self.set_error(error)
+                    return
+                logger.info(f"G-code job spans WPOS {low} to {high}.")
+                job["removed_commands"] = optimized.removed
+                self.metrics.count("gcode_removed", optimized.removed)
+                logger.info(f"Optimizer removed {optimized.removed} G-code commands.")
+                estimate = Estimate(planned)
+                job["estimatedtime"] = job["remainingtime"] = round(planned)
+                self.enable_steppers = True
+                await self.notify_listeners()
+                done = 0.0
+                optimized = gcodefile.Optimizer(
+                    moves.moves(gcode_pos, arc_tolerance),
+                    gcode_pos,
+                    merge_tolerance,
+                    spindle_start,
+                )
+                for record, (op, target, speed, spindle, duration) in enumerate(
+                    optimized
+                ):
+                    # the queued moves come to a halt before pausing, a stop
+                    # or an E-STOP discards them
+                    if self._stop.is_set():
+                        planner.discard()
+                    elif self._pause.is_set():
+                        await self.flush_moves(planner)
+                    # Check for pause/stop from the web UI
+                    if await self.handle_pausing_and_stopping():
+                        logger.info("G-code execution aborted/stopped by user.")
+                        planner.discard()
+                        break
+
+                    record_start = ticks_us()
+                    if op == gcodefile.OP_MOVE:
+                        # G-code targets are workspace coordinates, the
+                        # soft limits were checked for the whole job
+                        mpos = [a + b for a, b in zip(target, work_offset)]
+                        for move in planner.add(mpos, speed):
+                            await self.queue_move(move)
+                    elif op == gcodefile.OP_SPINDLE:
+                        await self.flush_moves(planner)
+                        await self.set_spindle(spindle)
+                    elif op == gcodefile.OP_HALT:
+                        await self.set_error("Unsupported G-code command. Halting.")
+                        break
+
+                    self.metrics.observe(
+                        "gcode_line_us", ticks_diff(ticks_us(), record_start)
+                    )
+                    done += duration
+                    if ticks_diff(ticks_ms(), last_progress) >= progress_ms:
+                        last_progress = ticks_ms()
+                        elapsed = ticks_diff(last_progress, started) / 1000
+                        job["printingtime"] = round(elapsed)
+                        job["remainingtime"] = estimate.remaining(done, elapsed)
+                        await self.notify_listeners()
+            # moves of a stopped job have been discarded
+            await self.flush_moves(planner)
+
+        except OSError:
+            await self.set_error(f"G-code file not found: {fname}")
+        except Exception as e:  # noqa: BLE001, all exceptions are caught
+            await self.set_error(f"Error executing G-code at move {record}: {e}")
+        finally:
+            # Clean up
+            await self.wait_moves()
+            if not keep_spindle:
+                await self.set_spindle(0)
+            await self.wait_fifo_empty()
+            self.enable_steppers = False
+            self.flush_position()
+            job["printingtime"] = round(ticks_diff(ticks_ms(), started) / 1000)
+            self.state["printing"] = False
+            await self.notify_listeners()
+            logger.info("G-code execution finished.")
@@ -0,0 +1,79 @@
+"""Print-time estimates of laser and G-code jobs.
+
+A job is planned from its contents and the machine configuration. While
+it runs, ``Estimate`` corrects the plan with the measured throughput.
+"""
+
+# speeds in mm/s assumed for G-code moves without a feedrate
+RAPID_SPEED = 20.0
+DEFAULT_FEED = 10.0
+# lane changes of a laser job move at the rapid speed
+MOVE_SPEED = RAPID_SPEED
+# planned seconds that have to be completed before the measured
+# throughput is trusted, the first lines include the acceleration
+MIN_MEASURED_S = 2.0
+
+
+def line_period(cfg, singlefacet=False):
+    """Returns the time in s needed to expose a single scanline."""
+    rpm = cfg.laser_timing["rpm"]
+    facets = cfg.laser_timing["facets"]
+    period = 60.0 / (rpm * facets)
+    # in single facet mode only one facet of every revolution is used
+    return period * facets if singlefacet else period
+
+
+def lane_times(cfg, extents, facets_lane, lane_width, exposures, singlefacet=False):
+    """Returns the planned time in s of every lane of a laser job.
+
+    Lanes are given by the ``(start, stop)`` extent of their exposed
+    scanlines. The time of a lane includes the move from the end of the
+    previous exposed lane, blank lanes take no time.
+    """
+    scan_axis = cfg.motor_cfg["orth2lsrline"]
+    mm_per_facet = (1.0 / exposures) / cfg.motor_cfg["steps_mm"][scan_axis]
+    lane_length = facets_lane * mm_per_facet
+    line_s = exposures * line_period(cfg, singlefacet)
+    x = y = 0.0
+    times = []
+    for lane, (start, stop) in enumerate(extents):
+        if start >= stop:
+            times.append(0.0)
+            continue
+        # odd lanes are exposed backward
+        if lane % 2 == 0:
+            begin, end = start * mm_per_facet, stop * mm_per_facet
+        else:
+            begin, end = (
+                lane_length - start * mm_per_facet,
+                lane_length - (stop * mm_per_facet),
+            )
+        lane_y = lane * lane_width
+        move = ((begin - x) ** 2 + (lane_y - y) ** 2) ** 0.5
+        times.append(move / MOVE_SPEED + (stop - start) * line_s)
+        x, y = end, lane_y
+    return times
+
+
+class Estimate:
+    """Remaining time of a running job.
+
+    ``planned`` is the planned time of the job in s. The measured time of
+    the completed work divided by its planned time corrects the planned
+    time of the work left, e.g. for a slower polygon or slower moves.
+    """
+
+    def __init__(self, planned):
+        self.planned = planned
+
+    def remaining(self, done, elapsed):
+        """Returns the remaining time in s.
+
+        Args:
+            done: planned time in s of the completed work
+            elapsed: measured time in s of the completed work
+        """
+        left = max(0.0, self.planned - done)
+        if done >= MIN_MEASURED_S and elapsed > 0:
+            left *= elapsed / done
+        return round(left)
@@ -0,0 +1,402 @@
+"""Compiled move lists of G-code jobs.
+
+A G-code job is compiled once into fixed-size binary records, executing
+it then needs no string parsing. The move list is cached in the ``.meta``
+folder of the job folder and compiled again if the size or modification
+time of the G-code file changed.
+
+The file holds a header (magic, version, size and modification time of
+the G-code file, number of records) followed by the records. A record
+holds an opcode, a mask of the axes it sets, the spindle value, the
+coordinates in mm, the speed in mm/s and the center offset of an arc.
+Modal commands, i.e. G90/G91 and feedrates, are resolved while
+compiling. Arcs are split into chords when the list is read, with the
+tolerance configured at that moment.
+"""
+
+import logging
+import os
+import struct
+
+from .arcs import chords
+from .estimate import DEFAULT_FEED, RAPID_SPEED
+
+logger = logging.getLogger(__name__)
+
+META_FOLDER = ".meta"
+
+MAGIC = b"HXG1"
+VERSION = 2
+# magic, version, source size, source mtime, records
+HEADER_FORMAT = "<4sHIII"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# opcode, axis mask, spindle, x, y, z, speed, i, j
+RECORD_FORMAT = "<BBBxffffff"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+OP_MOVE = 1
+OP_SPINDLE = 2
+OP_HALT = 3  # unsupported command, execution stops
+OP_ARC_CW = 4
+OP_ARC_CCW = 5
+# bits of the axis mask, the coordinates of a relative move are offsets
+AXES = "XYZ"
+RELATIVE = 8
+
+_BLOCK_RECORDS = 64
+# points a merged move may replace, bounds the cost of a merge
+_MERGE_POINTS = 32
+
+
+def compiled_path(path):
+    """Returns the path of the move list of the G-code file ``path``."""
+    folder, _, name = path.rpartition("/")
+    return f"{folder}/{META_FOLDER}/{name}.bin"
+
+
+def source_stamp(path):
+    """Returns size and modification time of ``path``."""
+    stat = os.stat(path)
+    return stat[6], int(stat[8])
+
+
+class Writer:
+    """Writes records to the move list at ``path``.
+
+    ``close`` completes the move list, ``abort`` removes it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self._block = bytearray(_BLOCK_RECORDS * RECORD_SIZE)
+        self._used = 0
+        try:
+            os.mkdir(path.rpartition("/")[0])
+        except OSError:
+            pass  # already exists
+        self._f = open(path, "wb")  # noqa: SIM115, closed by close or abort
+        # the header is written once the list is complete
+        self._f.write(bytes(HEADER_SIZE))
+
+    def emit(self, op, mask=0, spindle=0, x=0.0, y=0.0, z=0.0, speed=0.0, i=0.0, j=0.0):
+        struct.pack_into(
+            RECORD_FORMAT,
+            self._block,
+            self._used,
+            op,
+            mask,
+            spindle,
+            x,
+            y,
+            z,
+            speed,
+            i,
+            j,
+        )
+        self._used += RECORD_SIZE
+        self.records += 1
+        if self._used == len(self._block):
+            self._f.write(self._block)
+            self._used = 0
+
+    def close(self, size=0, mtime=0):
+        """Completes the move list with the ``size`` and ``mtime`` of its source."""
+        self._f.write(memoryview(self._block)[: self._used])
+        self._f.seek(0)
+        self._f.write(
+            struct.pack(HEADER_FORMAT, MAGIC, VERSION, size, mtime, self.records)
+        )
+        self._f.close()
+
+    def abort(self):
+        self._f.close()
+        remove(self.path)
+
+
+class Compiler(Writer):
+    """Compiles G-code fed in chunks into the move list at ``path``.
+
+    Lines may span chunks. ``finish`` completes the move list, ``abort``
+    removes it.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._rest = b""
+        self._absolute = True
+        self._feed = DEFAULT_FEED
+
+    def feed(self, chunk):
+        lines = (self._rest + bytes(chunk)).split(b"\n")
+        self._rest = lines.pop()
+        for line in lines:
+            self.parse_line(line.decode())
+
+    def parse_line(self, line):
+        # Strip comments starting with ';' or '('
+        line = line.split(";")[0].split("(")[0].strip().upper()
+        if not line:
+            return
+        tokens = line.split()
+        cmd = tokens[0]
+        # Parse parameters into a dictionary (e.g. {'X': 10.5, 'F': 300})
+        params = {}
+        for token in tokens[1:]:
+            if len(token) > 1 and token[0] in "XYZFSIJR":
+                try:
+                    params[token[0]] = float(token[1:])
+                except ValueError:
+                    pass  # Ignore malformed tokens
+        if cmd == "G20":
+            logger.warning("G20 (Inches) is not supported.")
+            self.emit(OP_HALT)
+        elif cmd == "G90":
+            self._absolute = True
+        elif cmd == "G91":
+            self._absolute = False
+        elif cmd in ("M3", "M03"):
+            # Spindle On (Default 255 if S is not provided)
+            spindle = max(0, min(255, int(params.get("S", 255))))
+            self.emit(OP_SPINDLE, spindle=spindle)
+        elif cmd in ("M5", "M05"):
+            self.emit(OP_SPINDLE, spindle=0)
+        elif cmd in ("G0", "G00", "G1", "G01", "G2", "G02", "G3", "G03"):
+            # G-code feedrates are in mm/min
+            if "F" in params:
+                self._feed = params["F"] / 60.0
+            speed = RAPID_SPEED if cmd in ("G0", "G00") else self._feed
+            mask = 0 if self._absolute else RELATIVE
+            coords = [0.0, 0.0, 0.0]
+            for idx, axis in enumerate(AXES):
+                if axis in params:
+                    mask |= 1 << idx
+                    coords[idx] = params[axis]
+            if cmd in ("G0", "G00", "G1", "G01"):
+                self.emit(OP_MOVE, mask, 0, coords[0], coords[1], coords[2], speed)
+            elif "I" in params or "J" in params:
+                # centers are relative to the start of the arc
+                op = OP_ARC_CW if cmd in ("G2", "G02") else OP_ARC_CCW
+                self.emit(
+                    op,
+                    mask,
+                    0,
+                    coords[0],
+                    coords[1],
+                    coords[2],
+                    speed,
+                    params.get("I", 0.0),
+                    params.get("J", 0.0),
+                )
+            else:
+                logger.warning(f"{cmd} without I and J is not supported.")
+                self.emit(OP_HALT)
+
+    def finish(self, source):
+        """Completes the move list of the G-code file ``source``."""
+        if self._rest:
+            self.parse_line(self._rest.decode())
+            self._rest = b""
+        self.close(*source_stamp(source))
+
+
+def compile_file(source, path):
+    """Compiles the G-code file ``source`` into the move list at ``path``."""
+    compiler = Compiler(path)
+    try:
+        with open(source, "rb") as f:
+            while True:
+                chunk = f.read(4096)
+                if not chunk:
+                    break
+                compiler.feed(chunk)
+        compiler.finish(source)
+    except Exception:
+        compiler.abort()
+        raise
+
+
+class MoveList:
+    """Move list opened from a binary file object.
+
+    Iterating yields the records as ``(opcode, mask, spindle, x, y, z,
+    speed, i, j)`` tuples.
+    """
+
+    def __init__(self, f):
+        self._f = f
+        header = f.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE:
+            raise ValueError("Move list is truncated")
+        magic, version, self.size, self.mtime, self.records = struct.unpack(
+            HEADER_FORMAT, header
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a move list of this version")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._f.close()
+
+    def __iter__(self):
+        self._f.seek(HEADER_SIZE)
+        block = bytearray(_BLOCK_RECORDS * RECORD_SIZE)
+        left = self.records
+        while left > 0:
+            count = min(left, _BLOCK_RECORDS)
+            if self._f.readinto(memoryview(block)[: count * RECORD_SIZE]) != (
+                count * RECORD_SIZE
+            ):
+                raise ValueError("Move list is truncated")
+            for idx in range(count):
+                yield struct.unpack_from(RECORD_FORMAT, block, idx * RECORD_SIZE)
+            left -= count
+
+    def moves(self, position, arc_tolerance):
+        """Yields ``(opcode, target, speed, spindle, duration)`` per record.
+
+        Targets are resolved from the start ``position`` in workspace
+        coordinates, the target list is updated in place. Arcs are split
+        into moves along chords within ``arc_tolerance`` in mm. The
+        duration in s assumes a constant speed.
+        """
+        pos = list(position)
+        for op, mask, spindle, x, y, z, speed, i, j in self:
+            if op not in (OP_MOVE, OP_ARC_CW, OP_ARC_CCW):
+                yield op, pos, speed, spindle, 0.0
+                continue
+            start = list(pos)
+            for idx, value in enumerate((x, y, z)):
+                if mask & (1 << idx):
+                    pos[idx] = value + pos[idx] if mask & RELATIVE else value
+            if op == OP_MOVE:
+                points = (pos,)
+            else:
+                points = chords(start, pos, (i, j), op == OP_ARC_CW, arc_tolerance)
+            for point in points:
+                length = sum((a - b) ** 2 for a, b in zip(point, start)) ** 0.5
+                start = point
+                yield OP_MOVE, point, speed, 0, length / speed if speed > 0 else 0.0
+
+
+class Optimizer:
+    """Merges collinear moves and drops commands without effect.
+
+    Wraps the ``(opcode, target, speed, spindle, duration)`` tuples of
+    ``MoveList.moves``. Consecutive moves at the same speed merge if the
+    points they skip stay within ``tolerance`` in mm of the merged move.
+    Moves of zero length and spindle commands that do not change the
+    spindle are dropped. ``removed`` counts the dropped records.
+
+    Args:
+        moves: output of ``MoveList.moves``
+        position: start position, as passed to ``MoveList.moves``
+        tolerance: allowed deviation in mm, zero only merges exact lines
+        spindle: spindle value at the start of the job
+    """
+
+    def __init__(self, moves, position, tolerance, spindle):
+        self._moves = moves
+        self._pos = list(position)
+        self.tolerance = tolerance
+        self.spindle = spindle
+        self.removed = 0
+
+    def _fits(self, start, end, points):
+        """True if ``points`` lie on the move from ``start`` to ``end``."""
+        delta = [b - a for a, b in zip(start, end)]
+        length2 = sum(d * d for d in delta)
+        if length2 <= 0:
+            return False
+        for point in points:
+            rel = [p - a for a, p in zip(start, point)]
+            t = sum(r * d for r, d in zip(rel, delta)) / length2
+            if t < 0 or t > 1:
+                return False
+            off = sum((r - t * d) ** 2 for r, d in zip(rel, delta))
+            if off > self.tolerance * self.tolerance:
+                return False
+        return True
+
+    def _move(self, end, speed):
+        length = sum((a - b) ** 2 for a, b in zip(end, self._pos)) ** 0.5
+        self._pos = end
+        return OP_MOVE, end, speed, 0, length / speed if speed > 0 else 0.0
+
+    def __iter__(self):
+        # move held back to merge it with the next ones
+        end = speed = None
+        skipped = []
+        for op, target, move_speed, spindle, _ in self._moves:
+            if op == OP_MOVE:
+                last = self._pos if end is None else end
+                if target == last:
+                    self.removed += 1
+                    continue
+                if (
+                    end is not None
+                    and move_speed == speed
+                    and len(skipped) < _MERGE_POINTS
+                    and self._fits(self._pos, target, skipped + [end])
+                ):
+                    skipped.append(end)
+                    end = list(target)
+                    self.removed += 1
+                    continue
+                if end is not None:
+                    yield self._move(end, speed)
+                end, speed, skipped = list(target), move_speed, []
+                continue
+            if op == OP_SPINDLE and spindle == self.spindle:
+                self.removed += 1
+                continue
+            if end is not None:
+                yield self._move(end, speed)
+                end = None
+            if op == OP_SPINDLE:
+                self.spindle = spindle
+            yield op, target, move_speed, spindle, 0.0
+        if end is not None:
+            yield self._move(end, speed)
+
+
+def load(source):
+    """Returns the move list of the G-code file ``source``.
+
+    The cached move list is compiled again if it is missing, stale or of
+    another version.
+    """
+    path = compiled_path(source)
+    stamp = source_stamp(source)
+    try:
+        moves = open_moves(path)
+    except (OSError, ValueError):
+        moves = None
+    if moves is not None:
+        if (moves.size, moves.mtime) == stamp:
+            return moves
+        moves.close()
+    compile_file(source, path)
+    return open_moves(path)
+
+
+def open_moves(path):
+    f = open(path, "rb")  # noqa: SIM115, closed by MoveList
+    try:
+        return MoveList(f)
+    except ValueError:
+        f.close()
+        raise
+
+
+def remove(path):
+    """Removes a move list, ``path`` as returned by ``compiled_path``."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,325 @@
+"""Reader and writer for laser exposure jobs (``.pat``).
+
+Two container versions are recognised:
+
+Version 1
+    A single ZLIB stream holding a 12-byte header (``lane_width`` f32,
+    ``facets_lane`` u32, ``lanes`` u32) followed by the scanlines of all
+    lanes. Exposures and optical correction are encoded in the filename,
+    see ``parse_job_suffix``. Lanes can only be read sequentially.
+
+Version 2
+    An uncompressed header with the job metadata, a lane table with one
+    ``(offset, length, crc32, start, stop)`` entry per lane and an
+    independently ZLIB-compressed block per lane. Any lane can be opened
+    in O(1). ``start`` and ``stop`` delimit the scanlines of the lane that
+    are not blank, an empty lane has ``start == stop``.
+"""
+
+import struct
+from binascii import crc32
+
+import deflate
+
+MAGIC = b"HXJ2"
+VERSION = 2
+# magic, version, lane_width, facets_lane, lanes, exposures, flags
+HEADER_FORMAT = "<4sHfIIBB"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# absolute offset, compressed length, crc32 of the compressed block,
+# first and one past the last scanline that is not blank
+LANE_FORMAT = "<IIIII"
+LANE_SIZE = struct.calcsize(LANE_FORMAT)
+FLAG_CORRECTION = 1
+
+_READ_SIZE = 4096
+
+
+def scan_extent(data, line_bytes, blank_line, header_bytes):
+    """Returns ``(first, last)`` index of the non-blank lines in ``data``.
+
+    A scanline is blank if it equals ``blank_line`` after its first
+    ``header_bytes``, these hold the steps and direction of the line.
+    Returns ``None`` if all lines are blank.
+    """
+    tail = blank_line[header_bytes:line_bytes]
+    first = last = None
+    for idx in range(len(data) // line_bytes):
+        start = idx * line_bytes
+        if data[start + header_bytes : start + line_bytes] != tail:
+            if first is None:
+                first = idx
+            last = idx
+    if first is None:
+        return None
+    return first, last
+
+
+class LaserJob:
+    """Laser job opened from a binary file object.
+
+    Attributes:
+        version: container version, 1 or 2
+        lane_width: lane width in mm as stored in the file
+        facets_lane: number of scanlines per lane
+        lanes: number of lanes
+        exposures: exposures per line, ``None`` for version 1
+        optical_correction: ``None`` for version 1
+    """
+
+    def __init__(self, f):
+        self._f = f
+        # stream of the lane that is read and the position within it,
+        # version 1 uses a single stream for all lanes
+        self._stream = None
+        self._lane = None
+        self._pos = 0
+        magic = f.read(len(MAGIC))
+        if magic == MAGIC:
+            self._read_header_v2(magic)
+        else:
+            f.seek(0)
+            self.version = 1
+            self._stream = deflate.DeflateIO(f, deflate.ZLIB)
+            self.lane_width = struct.unpack("<f", self._stream.read(4))[0]
+            self.facets_lane = struct.unpack("<I", self._stream.read(4))[0]
+            self.lanes = struct.unpack("<I", self._stream.read(4))[0]
+            self.exposures = None
+            self.optical_correction = None
+            self._table = None
+
+    def _read_header_v2(self, magic):
+        header = magic + self._f.read(HEADER_SIZE - len(magic))
+        if len(header) != HEADER_SIZE:
+            raise ValueError("Truncated job header")
+        (
+            _,
+            self.version,
+            self.lane_width,
+            self.facets_lane,
+            self.lanes,
+            self.exposures,
+            flags,
+        ) = struct.unpack(HEADER_FORMAT, header)
+        if self.version != VERSION:
+            raise ValueError(f"Unsupported job version {self.version}")
+        self.optical_correction = bool(flags & FLAG_CORRECTION)
+        self._table = self._f.read(self.lanes * LANE_SIZE)
+        if len(self._table) != self.lanes * LANE_SIZE:
+            raise ValueError("Truncated lane table")
+
+    def header(self):
+        """Returns the job metadata as a dictionary."""
+        return {
+            "version": self.version,
+            "lane_width": self.lane_width,
+            "facets_lane": self.facets_lane,
+            "lanes": self.lanes,
+            "exposures": self.exposures,
+            "optical_correction": self.optical_correction,
+        }
+
+    def lane_entry(self, lane):
+        """Returns ``(offset, length, crc32, start, stop)`` of a lane (version 2)."""
+        return struct.unpack_from(LANE_FORMAT, self._table, lane * LANE_SIZE)
+
+    def extents(self, line_bytes, blank_line, header_bytes):
+        """Returns ``(start, stop)`` of the non-blank scanlines of every lane.
+
+        Version 2 stores the extents in its lane table. Version 1 has to be
+        inflated completely, which consumes the stream, so scan with a
+        separate ``LaserJob`` instance.
+        """
+        if self._table is not None:
+            return [self.lane_entry(lane)[3:5] for lane in range(self.lanes)]
+        result = []
+        for _ in self.scan(line_bytes, blank_line, header_bytes, result):
+            pass
+        return result
+
+    def scan(self, line_bytes, blank_line, header_bytes, result):
+        """Scans a version 1 job for the extents of its lanes.
+
+        Appends ``(start, stop)`` of every lane to ``result``. Yields after
+        every block that was inflated, so a caller can let other tasks run
+        during a scan of a large job.
+        """
+        lines = max(1, _READ_SIZE // line_bytes)
+        buf = bytearray(lines * line_bytes)
+        view = memoryview(buf)
+        for _ in range(self.lanes):
+            first = last = None
+            for facet in range(0, self.facets_lane, lines):
+                n = min(lines, self.facets_lane - facet) * line_bytes
+                if self._stream.readinto(view[:n]) != n:
+                    raise ValueError("Job data is truncated")
+                self._pos += n
+                extent = scan_extent(buf[:n], line_bytes, blank_line, header_bytes)
+                if extent is not None:
+                    if first is None:
+                        first = facet + extent[0]
+                    last = facet + extent[1]
+                yield
+            result.append((0, 0) if first is None else (first, last + 1))
+
+    def stream_at(self, lane, facet, line_bytes):
+        """Returns a stream positioned at scanline ``facet`` of ``lane``.
+
+        Version 2 seeks to the lane block and verifies its CRC first.
+        Version 1 has to inflate and discard the lanes in between, and
+        cannot go back to data that was already read. Within a lane,
+        both versions inflate and discard the lines before ``facet``.
+        """
+        if not 0 <= lane < self.lanes:
+            raise IndexError(f"Lane {lane} out of range")
+        if self._table is not None:
+            if lane != self._lane:
+                offset, length, crc, _, _ = self.lane_entry(lane)
+                self._verify(lane, offset, length, crc)
+                self._f.seek(offset)
+                self._stream = deflate.DeflateIO(self._f, deflate.ZLIB)
+                self._lane = lane
+                self._pos = 0
+            target = facet * line_bytes
+        else:
+            target = (lane * self.facets_lane + facet) * line_bytes
+        if target < self._pos:
+            raise ValueError("Job data can only be read forward")
+        self._discard(target - self._pos)
+        return self._stream
+
+    def _discard(self, skip):
+        if skip:
+            scratch = memoryview(bytearray(min(skip, _READ_SIZE)))
+            while skip:
+                n = self._stream.readinto(scratch[: min(skip, len(scratch))])
+                if not n:
+                    raise ValueError("Job data is truncated")
+                skip -= n
+                self._pos += n
+
+    def _verify(self, lane, offset, length, crc):
+        self._f.seek(offset)
+        buf = bytearray(_READ_SIZE)
+        view = memoryview(buf)
+        value = 0
+        remaining = length
+        while remaining:
+            n = self._f.readinto(view[: min(remaining, _READ_SIZE)])
+            if not n:
+                raise ValueError(f"Lane {lane} is truncated")
+            value = crc32(view[:n], value)
+            remaining -= n
+        if value & 0xFFFFFFFF != crc:
+            raise ValueError(f"Lane {lane} is corrupt (CRC mismatch)")
+
+    def chunks(self, lines_chunk, line_bytes, start_lane=0, extents=None):
+        """Yields ``(stream, size)`` for every chunk from ``start_lane`` onwards.
+
+        Chunks never cross a lane boundary, so the last chunk of a lane can
+        be shorter than ``lines_chunk`` lines. With ``extents``, empty lanes
+        are skipped and lanes are trimmed to ``(start, stop)``. The consumer
+        must read each chunk before requesting the next one.
+        """
+        for lane in range(start_lane, self.lanes):
+            start, stop = extents[lane] if extents else (0, self.facets_lane)
+            if start >= stop:
+                continue
+            stream = self.stream_at(lane, start, line_bytes)
+            for facet in range(start, stop, lines_chunk):
+                size = min(lines_chunk, stop - facet) * line_bytes
+                yield stream, size
+                self._pos += size
+
+
+def parse_job_suffix(fname):
+    """Extract per-line exposure count and optical-correction flag from the job filename.
+
+    Expected filename stem pattern: ``<base>_e<N>_<cor|nocor>``
+    e.g. ``circuit_e1_nocor.pat``  or  ``circuit_e4_cor.pat``
+
+    Returns:
+        (file_exposures: int, optical_correction: bool), or (None, None) if the
+        suffix is absent or malformed.
+    """
+    # Strip path and extension, work with the bare stem
+    stem = fname.rsplit(".", 1)[0].rsplit("/", 1)[-1]
+    parts = stem.split("_")
+    if len(parts) < 3:  # need at least <base> _e<N> _<cor|nocor>
+        return None, None
+    cor_part = parts[-1]
+    exp_part = parts[-2]
+    if cor_part not in ("cor", "nocor"):
+        return None, None
+    if not exp_part.startswith("e"):
+        return None, None
+    try:
+        file_exposures = int(float(exp_part[1:]))
+    except ValueError:
+        return None, None
+    return file_exposures, cor_part == "cor"
+
+
+def read_header(path):
+    """Reads the metadata of the job stored at ``path``."""
+    with open(path, "rb") as f:
+        return LaserJob(f).header()
+
+
+def write_job(
+    f,
+    lanes_data,
+    lane_width,
+    facets_lane,
+    exposures=1,
+    optical_correction=False,
+    blank_line=None,
+    header_bytes=0,
+):
+    """Writes a version 2 job to the binary file object ``f``.
+
+    Host-side helper, compression relies on CPython's ``zlib``.
+
+    Args:
+        lanes_data: scanline bytes of every lane
+        lane_width: lane width in mm
+        facets_lane: number of scanlines per lane
+        exposures: exposures per line the scanlines were prepared for
+        optical_correction: whether the scanlines include optical correction
+        blank_line: scanline without exposure, used to store the extent of
+            every lane, if omitted lanes are never trimmed
+        header_bytes: leading bytes of a scanline ignored when comparing
+            with ``blank_line``
+    """
+    import zlib
+
+    blocks = []
+    extents = []
+    for data in lanes_data:
+        data = bytes(data)
+        blocks.append(zlib.compress(data, 9))
+        if blank_line is None:
+            extents.append((0, facets_lane))
+            continue
+        extent = scan_extent(data, len(blank_line), blank_line, header_bytes)
+        extents.append((0, 0) if extent is None else (extent[0], extent[1] + 1))
+    flags = FLAG_CORRECTION if optical_correction else 0
+    f.write(
+        struct.pack(
+            HEADER_FORMAT,
+            MAGIC,
+            VERSION,
+            lane_width,
+            facets_lane,
+            len(blocks),
+            exposures,
+            flags,
+        )
+    )
+    offset = HEADER_SIZE + len(blocks) * LANE_SIZE
+    for block, (start, stop) in zip(blocks, extents):
+        entry = (offset, len(block), crc32(block), start, stop)
+        f.write(struct.pack(LANE_FORMAT, *entry))
+        offset += len(block)
+    for block in blocks:
+        f.write(block)
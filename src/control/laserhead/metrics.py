@@ -0,0 +1,112 @@
+import gc
+
+# MicroPython has no collection counter, collections show up as a drop of
+# the allocated memory
+MICROPYTHON_GC = hasattr(gc, "mem_alloc")
+# a histogram bucket holds the values below a power of two, the last one
+# all larger values, with microseconds it ends at about 8 s
+BUCKETS = 24
+
+
+class Histogram:
+    """Histogram with power-of-two buckets, cheap enough for the hot path."""
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        value = int(value)
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        idx = 0
+        while value >> idx and idx < BUCKETS - 1:
+            idx += 1
+        self.buckets[idx] += 1
+
+    def summary(self):
+        """Returns the statistics and the non-empty buckets by upper bound."""
+        buckets = {}
+        for idx, count in enumerate(self.buckets):
+            if count:
+                bound = "inf" if idx == BUCKETS - 1 else str(1 << idx)
+                buckets[bound] = count
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": round(self.total / self.count, 1) if self.count else 0,
+            "max": self.max,
+            "buckets": buckets,
+        }
+
+
+class Metrics:
+    """Counters and histograms of the laserhead served at ``/api/metrics``.
+
+    Durations are observed in microseconds, names end with their unit.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(value)
+
+    def snapshot(self):
+        return {
+            "counters": dict(self.counters),
+            "histograms": {
+                name: histogram.summary() for name, histogram in self.histograms.items()
+            },
+            "gc": gc_state(),
+        }
+
+
+def gc_state():
+    """Returns the memory of MicroPython or the collections of CPython."""
+    if MICROPYTHON_GC:
+        return {"mem_free": gc.mem_free(), "mem_alloc": gc.mem_alloc()}
+    return {"collections": sum(gen["collections"] for gen in gc.get_stats())}
+
+
+class GcMonitor:
+    """Detects garbage collections that were not started explicitly.
+
+    On MicroPython ``mem_alloc`` walks the heap, poll at a low rate. Polls
+    further apart than a collection cycle miss collections.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def _mark(self):
+        if MICROPYTHON_GC:
+            return gc.mem_alloc()
+        return sum(gen["collections"] for gen in gc.get_stats())
+
+    def reset(self):
+        """Call after an explicit collection, it is not counted."""
+        self._last = self._mark()
+
+    def poll(self):
+        """Returns the number of collections since the last call."""
+        mark = self._mark()
+        if MICROPYTHON_GC:
+            collections = 1 if mark < self._last else 0
+        else:
+            collections = mark - self._last
+        self._last = mark
+        return collections
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+from time import ticks_diff, ticks_us
 
 from hexastorm.fpga_host.micropython import ESP32Host
 from hexastorm.fpga_host.syncwrap import syncable
@@ -12,6 +13,9 @@ logger = logging.getLogger(__name__)
 
 
 class Laserhead(ESP32Host, BaseLaserhead):
+    # gotopoint blocks until a move has finished
+    queued_moves = False
+
     def __init__(self):
         ESP32Host.__init__(self)
         BaseLaserhead.__init__(
@@ -30,6 +34,13 @@ class Laserhead(ESP32Host, BaseLaserhead):
         constants.CONFIG["laserhead"]["facetmeans"] = self.cur_facet_means
         constants.update_config()
 
+    async def facet_period(self):
+        """Returns the mean facet period in ms, None without photodiode pulses."""
+        if not (await self.fpga_state)["photodiode_trigger"]:
+            return None
+        means = await self.measure_facet_means()
+        return sum(means) / len(means) if means else None
+
     async def remap(self, facet_id=0):
         """
         Maps a calibrated facet ID to its current physical index
@@ -91,6 +102,13 @@ class Laserhead(ESP32Host, BaseLaserhead):
         await super().toggle_prism()
         await self.enable_comp(polygon=self.state["components"]["rotating"])
 
+    async def send_command(self, command, timeout=0):
+        start = ticks_us()
+        result = await ESP32Host.send_command(self, command, timeout=timeout)
+        self.metrics.observe("spi_us", ticks_diff(ticks_us(), start))
+        self.metrics.count("bytes_sent", len(command))
+        return result
+
     async def gotopoint(
         self,
         position,
@@ -109,6 +127,7 @@ class Laserhead(ESP32Host, BaseLaserhead):
             self._validate_target_position(
                 position, absolute=absolute, workspace=workspace
             )
+        start = ticks_us()
 
         # 1. Execute hardware command (blocks until physical move is complete)
         result = await ESP32Host.gotopoint(
@@ -120,6 +139,7 @@ class Laserhead(ESP32Host, BaseLaserhead):
             check_sensors=check_sensors,
             validate_limits=validate_limits,
         )
+        self.metrics.observe("move_us", ticks_diff(ticks_us(), start))
 
         # 2. Update RAM and NVS instantly using the synchronous helper from base.py
         self._save_position()
@@ -128,6 +148,26 @@ class Laserhead(ESP32Host, BaseLaserhead):
         await self.notify_listeners()
         return result
 
+    async def queue_move(self, move):
+        """Moves along a planned move of the G-code planner.
+
+        The host has no queued move instruction, the move is executed by
+        ``gotopoint`` at its nominal speed and finishes before the next one.
+        The planner stops at every corner for this, see ``queued_moves``.
+        """
+        start = ticks_us()
+        await self.gotopoint(
+            move.target,
+            speed=move.speed,
+            absolute=True,
+            check_sensors=False,
+            validate_limits=False,
+        )
+        self.metrics.observe("queue_move_us", ticks_diff(ticks_us(), start))
+
+    async def wait_moves(self):
+        """Moves finish within ``queue_move``, there is nothing to wait for."""
+
     async def emergency_stop(self):
         """Hardware emergency stop: holds fpga_reset LOW to reset FPGA logic & FIFOs."""
         logger.warning("Hardware EMERGENCY ABORT triggered!")
@@ -238,140 +278,6 @@ class Laserhead(ESP32Host, BaseLaserhead):
             await self.enable_comp(polygon=cur_polygon)
         await self.notify_listeners()
 
-    async def execute_gcode(self, fname):
-        """
-        Parses and executes a standard G-code file for 2.5D PCB milling.
-        Supports:
-            G0/G1: Linear motion
-            G90/G91: Absolute/Relative positioning
-            G21: Millimeters mode (enforced)
-            F: Feedrate (mm/min -> converted to mm/s)
-            M3/M5: Spindle On/Off
-        """
-        logger.info(f"Starting G-Code execution: {fname}")
-
-        # Setup default state for execution
-        # Spindle starts off, positioning starts absolute
-        is_absolute = True
-        current_feedrate_mms = 10.0  # Default fallback speed
-        self.state["printing"] = True
-        self.enable_steppers = True
-        await self.notify_listeners()
-
-        # We need a tracker for current position because G-code can omit axes.
-        # e.g., if we are at [10, 10, 0] and command is "G1 X20", Y and Z remain unchanged.
-        # We initialize it with our current WPOS (Workspace Position)
-        gcode_pos = self.wpos
-
-        try:
-            filepath = self.get_job_path(fname)
-            with open(filepath, "r") as f:  # noqa: ASYNC230, works in micropython
-                for line_num, line in enumerate(f):
-                    # Check for pause/stop from the web UI
-                    if await self.handle_pausing_and_stopping():
-                        logger.info("G-code execution aborted/stopped by user.")
-                        break
-
-                    # Parse the line
-                    # Strip comments starting with ';' or '('
-                    line = line.split(";")[0].split("(")[0].strip().upper()
-                    if not line:
-                        continue
-
-                    tokens = line.split()
-                    cmd = tokens[0]
-
-                    # Parse parameters into a dictionary (e.g. {'X': 10.5, 'F': 300})
-                    params = {}
-                    for token in tokens[1:]:
-                        if len(token) > 1 and token[0] in "XYZFSIJ":
-                            try:
-                                params[token[0]] = float(token[1:])
-                            except ValueError:
-                                pass  # Ignore malformed tokens
-
-                    # Execution State Machine
-                    if cmd == "G21":
-                        pass  # Millimeters - expected default
-
-                    elif cmd == "G20":
-                        logger.warning("G20 (Inches) is not supported. Halting.")
-                        break
-
-                    elif cmd == "G90":
-                        is_absolute = True
-
-                    elif cmd == "G91":
-                        is_absolute = False
-
-                    elif cmd in ["M3", "M03"]:
-                        # Spindle On (Default 255 if S is not provided)
-                        spindle_speed = int(params.get("S", 255))
-                        await self.set_spindle(spindle_speed)
-
-                    elif cmd in ["M5", "M05"]:
-                        # Spindle Off
-                        await self.set_spindle(0)
-
-                    elif cmd in ["G0", "G00", "G1", "G01"]:
-                        # Linear Motion
-                        # Update feedrate if provided (G-code feedrate is mm/min, gotopoint needs mm/s)
-                        if "F" in params:
-                            current_feedrate_mms = params["F"] / 60.0
-
-                        # Determine speed (Rapid vs Feed)
-                        # Assume rapid G0 is just a fast feedrate (e.g., 20 mm/s).
-                        # Adjust this based on your machine's physical limits.
-                        move_speed = (
-                            20.0 if cmd in ["G0", "G00"] else current_feedrate_mms
-                        )
-
-                        # Construct target position
-                        # If an axis is missing in the command, it stays at its current value
-                        target_pos = list(gcode_pos)  # Copy current state
-
-                        if is_absolute:
-                            if "X" in params:
-                                target_pos[0] = params["X"]
-                            if "Y" in params:
-                                target_pos[1] = params["Y"]
-                            if "Z" in params:
-                                target_pos[2] = params["Z"]
-                            # Update our internal tracker
-                            gcode_pos = list(target_pos)
-                        else:
-                            dx = params.get("X", 0.0)
-                            dy = params.get("Y", 0.0)
-                            dz = params.get("Z", 0.0)
-                            target_pos = [dx, dy, dz]
-                            # Update our internal tracker for future lines
-                            gcode_pos[0] += dx
-                            gcode_pos[1] += dy
-                            gcode_pos[2] += dz
-
-                        # Execute the physical move
-                        # G-code targets are inherently workspace coordinates (relative to origin)
-                        await self.gotopoint(
-                            position=target_pos,
-                            speed=move_speed,
-                            absolute=is_absolute,
-                            workspace=True,  # G-code ALWAYS operates in workspace coords
-                            check_sensors=False,  # Head experiences force by definition
-                        )
-
-        except OSError:
-            logger.error(f"G-code file not found: {fname}")
-        except Exception as e:  # noqa: BLE001, all exceptions are caught
-            logger.error(f"Error executing G-code at line {line_num}: {e}")
-        finally:
-            # Clean up
-            await self.set_spindle(0)
-            await self.wait_fifo_empty()
-            self.enable_steppers = False
-            self.state["printing"] = False
-            await self.notify_listeners()
-            logger.info("G-code execution finished.")
-
 
 @syncable
 class LaserheadSync(Laserhead):
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkPipeline:
+    """Producer/consumer stage between the job decompressor and the SPI bus.
+
+    A background task inflates the next chunks into a small ring of
+    preallocated buffers, while the consumer transmits the current one.
+    Decompression and SD reads thereby overlap with FPGA transfers.
+
+    Usage::
+
+        pipeline = ChunkPipeline(chunk_bytes)
+        pipeline.start(job.chunks(lines_chunk, line_bytes))
+        try:
+            chunk = await pipeline.get()
+            await self.send_command(chunk)
+            pipeline.release()
+        finally:
+            pipeline.close()
+    """
+
+    def __init__(self, chunk_bytes, depth=2, buffers=None):
+        # preallocated ring buffers of chunk_bytes can be passed to reuse
+        # them between jobs, depth is then ignored
+        if buffers is None:
+            buffers = [bytearray(chunk_bytes) for _ in range(depth)]
+        self._ring = buffers
+        self._views = [memoryview(buf) for buf in self._ring]
+        depth = len(buffers)
+        self._sizes = [0] * depth
+        self._head = 0  # next buffer to fill
+        self._tail = 0  # next buffer to consume
+        self._filled = 0
+        self._error = None
+        self._done = False
+        self._data_ready = asyncio.Event()
+        self._space_ready = asyncio.Event()
+        self._task = None
+
+    def start(self, chunks):
+        """Starts inflating chunks in the background.
+
+        Args:
+            chunks: iterable of ``(stream, size)``, the stream must provide
+                ``readinto`` as ``deflate.DeflateIO`` does
+        """
+        self._task = asyncio.create_task(self._produce(chunks))
+
+    async def _produce(self, chunks):
+        depth = len(self._ring)
+        try:
+            for stream, size in chunks:
+                while self._filled == depth:
+                    self._space_ready.clear()
+                    await self._space_ready.wait()
+                # decompress straight into the ring, no intermediate bytes
+                view = self._views[self._head]
+                self._sizes[self._head] = stream.readinto(view[:size])
+                self._head = (self._head + 1) % depth
+                self._filled += 1
+                self._data_ready.set()
+                # give the consumer a chance to transmit
+                await asyncio.sleep(0)
+        except Exception as e:  # noqa: BLE001, re-raised in the consumer
+            logger.error(f"Decompressing job failed: {e}")
+            self._error = e
+        self._done = True
+        self._data_ready.set()
+
+    async def get(self):
+        """Returns the oldest inflated chunk, waiting for the producer if needed.
+
+        The chunk is a memoryview into the ring and stays valid until
+        ``release``. Only a chunk shorter than a ring buffer needs a new view.
+        """
+        while self._filled == 0:
+            if self._error is not None:
+                raise self._error
+            if self._done:
+                raise EOFError("Job data exhausted")
+            self._data_ready.clear()
+            await self._data_ready.wait()
+        idx = self._tail
+        size = self._sizes[idx]
+        if size == len(self._ring[idx]):
+            return self._views[idx]
+        return self._views[idx][:size]
+
+    def release(self):
+        """Hands the chunk returned by ``get`` back to the producer."""
+        self._tail = (self._tail + 1) % len(self._ring)
+        self._filled -= 1
+        self._space_ready.set()
+
+    def close(self):
+        """Stops the producer task."""
+        if self._task is not None and not self._done:
+            self._task.cancel()
+        self._task = None
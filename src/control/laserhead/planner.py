@@ -0,0 +1,155 @@
+"""Look-ahead planning of G-code moves.
+
+Moves are held in a bounded look-ahead queue. The speed at the junction
+of two moves is limited by the angle between them and the acceleration
+of the axes, each move accelerates or decelerates within its length. A
+move leaves the queue once it is planned, the moves behind it are planned
+such that the machine can still stop at the end of the queue. Moves thus
+blend into each other instead of starting and stopping at rest.
+"""
+
+import math
+
+# cosines beyond which moves are considered straight or reversed
+STRAIGHT = -0.999999
+REVERSED = 0.999999
+
+
+def move_time(length, entry, speed, exit, accel):
+    """Returns the time in s of a move with a trapezoidal speed profile.
+
+    Speeds are in mm/s, the acceleration in mm/s². If the move is too
+    short to reach ``speed``, the profile is triangular.
+    """
+    if length <= 0 or speed <= 0:
+        return 0.0
+    if accel <= 0:
+        return length / speed
+    accelerate = (speed * speed - entry * entry) / (2 * accel)
+    decelerate = (speed * speed - exit * exit) / (2 * accel)
+    if accelerate + decelerate <= length:
+        cruise = length - accelerate - decelerate
+        return (2 * speed - entry - exit) / accel + cruise / speed
+    peak = math.sqrt((2 * accel * length + entry * entry + exit * exit) / 2)
+    return (2 * peak - entry - exit) / accel
+
+
+class Move:
+    """A straight move to ``target`` in machine coordinates.
+
+    ``speed`` is the nominal speed in mm/s, ``entry`` and ``exit`` are the
+    planned speeds at its start and end.
+    """
+
+    def __init__(self, start, target, speed, accel):
+        self.target = list(target)
+        delta = [b - a for a, b in zip(start, target)]
+        self.length = math.sqrt(sum(d * d for d in delta))
+        if self.length > 0:
+            self.unit = [d / self.length for d in delta]
+            # the slowest axis limits the acceleration along the move
+            self.accel = min(a / abs(u) for a, u in zip(accel, self.unit) if u)
+        else:
+            self.unit = [0.0] * len(delta)
+            self.accel = 0.0
+        self.speed = speed
+        self.max_entry = 0.0
+        self.entry = 0.0
+        self.exit = 0.0
+
+    @property
+    def duration(self):
+        return move_time(self.length, self.entry, self.speed, self.exit, self.accel)
+
+
+class Planner:
+    """Bounded look-ahead queue of moves.
+
+    Args:
+        accel: acceleration limit in mm/s² of every axis
+        junction_deviation: deviation in mm from the corner of a junction
+            allowed to pass it without stopping, zero stops at every corner
+        depth: number of moves kept to plan ahead
+        position: start position in machine coordinates
+    """
+
+    def __init__(self, accel, junction_deviation, depth, position):
+        self.accel = list(accel)
+        self.junction_deviation = junction_deviation
+        self.depth = max(1, depth)
+        self.position = list(position)
+        # end of the last move that left the look-ahead
+        self._released = list(position)
+        self._queue = []
+        self._entry = 0.0  # fixed entry speed of the first queued move
+
+    def _junction_speed(self, prev, move):
+        cos = -sum(a * b for a, b in zip(prev.unit, move.unit))
+        if cos < STRAIGHT:
+            return move.speed
+        if cos > REVERSED:
+            return 0.0
+        sin_half = math.sqrt(0.5 * (1.0 - cos))
+        accel = min(prev.accel, move.accel)
+        return math.sqrt(accel * self.junction_deviation * sin_half / (1.0 - sin_half))
+
+    def _plan(self):
+        # backward, every move can decelerate to the rest at the end
+        entry = 0.0
+        for move in reversed(self._queue):
+            move.entry = min(
+                move.max_entry, math.sqrt(entry * entry + 2 * move.accel * move.length)
+            )
+            entry = move.entry
+        # forward, every move reaches its exit from its entry
+        speed = self._entry
+        for idx, move in enumerate(self._queue):
+            move.entry = speed
+            limit = self._queue[idx + 1].entry if idx + 1 < len(self._queue) else 0.0
+            move.exit = min(
+                limit, math.sqrt(speed * speed + 2 * move.accel * move.length)
+            )
+            speed = move.exit
+
+    def _pop(self):
+        move = self._queue.pop(0)
+        self._entry = move.exit
+        self._released = move.target
+        return move
+
+    def add(self, target, speed):
+        """Queues a move to ``target`` at ``speed`` in mm/s.
+
+        Returns the planned moves that left the look-ahead, moves of zero
+        length are dropped.
+        """
+        move = Move(self.position, target, speed, self.accel)
+        if move.length <= 0 or speed <= 0:
+            return []
+        self.position = list(target)
+        if self._queue:
+            prev = self._queue[-1]
+            move.max_entry = min(
+                move.speed, prev.speed, self._junction_speed(prev, move)
+            )
+        self._queue.append(move)
+        self._plan()
+        released = []
+        while len(self._queue) > self.depth:
+            released.append(self._pop())
+        return released
+
+    def flush(self):
+        """Returns all queued moves, the last one ends at rest."""
+        released = [self._pop() for _ in range(len(self._queue))]
+        self._entry = 0.0
+        return released
+
+    def discard(self):
+        """Drops the queued moves, e.g. on a stop.
+
+        The position returns to the end of the last released move.
+        """
+        self._queue = []
+        self._entry = 0.0
+        self.position = list(self._released)
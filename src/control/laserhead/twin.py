@@ -0,0 +1,166 @@
+from time import time
+
+from hexastorm.config import Spi
+
+from .estimate import MOVE_SPEED, line_period
+
+
+class FPGATwin:
+    """Timing model of the FPGA behind the CPython mock of the laserhead.
+
+    Scanlines are written over SPI into a FIFO of ``fifo_words`` words and
+    consumed at the polygon rate while the laser is synchronized and the
+    FPGA parses. Words that do not fit block the writer until the FIFO
+    has drained, like ``mem_full`` does on the hardware. Moves start once
+    the FIFO is empty and update the stepper position over their
+    duration. Queued moves run back to back, at most ``move_slots`` wait.
+
+    The model runs ``speedup`` times faster than the wall clock, durations
+    it returns are in wall-clock seconds.
+    """
+
+    def __init__(self, cfg, spi_hz, fifo_words, speedup=1.0, move_slots=16):
+        self.cfg = cfg
+        self.spi_hz = spi_hz
+        self.fifo_words = fifo_words
+        self.speedup = speedup
+        self.move_slots = move_slots
+        self.word_bytes = Spi.command_bytes + Spi.word_bytes
+        self.words_line = cfg.hdl_cfg.words_scanline
+        self.parsing = False
+        self.synchronized = False
+        self.singlefacet = False
+        self.position = [0.0, 0.0, 0.0]
+        self._moves = []  # (start, target, begin, duration) of pending moves
+        self.reset()
+
+    def reset(self):
+        """Flushes the FIFO and clears the counters."""
+        self._t = self._now()
+        self.fifo = 0.0
+        self.words_sent = 0
+        self.lines_exposed = 0.0
+        self.drained = 0  # times the FIFO ran empty while consuming
+
+    def _now(self):
+        return time() * self.speedup
+
+    @property
+    def consuming(self):
+        return self.parsing and self.synchronized
+
+    def _word_rate(self):
+        return self.words_line / line_period(self.cfg, self.singlefacet)
+
+    def _advance(self):
+        now = self._now()
+        if self.consuming and self.fifo > 0:
+            used = min(self.fifo, (now - self._t) * self._word_rate())
+            self.fifo -= used
+            self.lines_exposed += used / self.words_line
+            if self.fifo <= 0:
+                self.fifo = 0.0
+                self.drained += 1
+        self._t = now
+
+    def write(self, nbytes):
+        """Queues ``nbytes`` of SPI data, returns the seconds the write takes.
+
+        The transfer takes the time to clock the bytes out, or the time the
+        FIFO needs to make room for them if it is longer. Without
+        consumption, data exceeding the FIFO stays queued until it starts.
+        """
+        self._advance()
+        words = nbytes // self.word_bytes
+        self.words_sent += words
+        duration = nbytes * 8 / self.spi_hz
+        excess = self.fifo + words - self.fifo_words
+        if excess > 0 and self.consuming:
+            duration = max(duration, excess / self._word_rate())
+        self.fifo += words
+        return duration / self.speedup
+
+    def _lines_time(self):
+        """Returns the model time until the scanlines are exposed."""
+        if not self.fifo:
+            return 0.0
+        if not self.consuming:
+            return None
+        return self.fifo / self._word_rate()
+
+    def drain_time(self):
+        """Returns the seconds until the FIFO is empty, None if it stalls.
+
+        The FIFO holds the scanlines and the moves that did not finish.
+        """
+        self._advance()
+        wait = self._lines_time()
+        if wait is None:
+            return None
+        if self._moves:
+            last = self._moves[-1]
+            wait = max(wait, last[2] + last[3] - self._now())
+        return wait / self.speedup
+
+    def _queue(self, target, duration):
+        """Appends a move, returns the model time at which it ends."""
+        self._advance()
+        self.stepper_position()  # drops the finished moves
+        now = self._now()
+        begin = now + (self._lines_time() or 0.0)
+        if self._moves:
+            prev = self._moves[-1]
+            start = prev[1]
+            begin = max(begin, prev[2] + prev[3])
+        else:
+            start = list(self.position)
+        self._moves.append((start, list(target), begin, duration))
+        return begin + duration
+
+    def move(self, target, speed=None):
+        """Starts a move to the machine position ``target`` in mm.
+
+        Returns the seconds until the move has finished, the move waits
+        for the scanlines in the FIFO and the queued moves.
+        """
+        start = self._moves[-1][1] if self._moves else self.stepper_position()
+        distance = sum((a - b) ** 2 for a, b in zip(target, start)) ** 0.5
+        end = self._queue(target, distance / (speed or MOVE_SPEED))
+        return (end - self._now()) / self.speedup
+
+    def queue_move(self, target, duration):
+        """Queues a move to ``target`` taking ``duration`` s of model time.
+
+        Returns the seconds until the move is accepted, i.e. until fewer
+        than ``move_slots`` moves wait in front of it.
+        """
+        self._queue(target, duration)
+        if len(self._moves) <= self.move_slots:
+            return 0.0
+        ahead = self._moves[-self.move_slots - 1]
+        return max(0.0, ahead[2] + ahead[3] - self._now()) / self.speedup
+
+    def stepper_position(self):
+        """Returns the machine position in mm of the steppers at this moment."""
+        now = self._now()
+        while self._moves:
+            start, target, begin, duration = self._moves[0]
+            done = 1.0 if duration <= 0 else (now - begin) / duration
+            if done < 1.0:
+                done = max(0.0, done)
+                return [a + (b - a) * done for a, b in zip(start, target)]
+            self.position = target
+            self._moves.pop(0)
+        return list(self.position)
+
+    def state(self):
+        """Returns the FPGA state flags as read over SPI."""
+        self._advance()
+        return {
+            "parsing": self.parsing,
+            "error": False,
+            "mem_full": self.fifo >= self.fifo_words,
+            "mem_empty": self.fifo <= 0,
+            "photodiode_trigger": True,
+            "synchronized": self.synchronized,
+        }
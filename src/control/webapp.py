@@ -11,9 +11,17 @@ from microdot.session import Session, with_session
 from microdot.sse import with_sse
 from microdot.utemplate import Template
 
-from . import bootlib, constants
-from .constants import CONFIG, CONFIG_FILE, NVS_FILE, update_config
-from .laserhead import laserhead
+from . import bootlib, constants, jobinfo
+from .constants import (
+    CHECKPOINT_FILE,
+    CONFIG,
+    CONFIG_FILE,
+    NVS_FILE,
+    QUEUE_FILE,
+    update_config,
+)
+from .jobqueue import JobQueue
+from .laserhead import gcodefile, laserhead
 
 logger = logging.getLogger(__name__)
 
@@ -74,24 +82,38 @@ def pass_to_sha(password):
 class DeviceState:
     """Aggregates the total state of the machine for the UI."""
 
-    def __init__(self, laserhead):
+    def __init__(self, laserhead, jobqueue):
         self.laserhead = laserhead
+        self.jobqueue = jobqueue
         self.data = {}
+        # metadata of the jobs, loaded from the sidecar files once
+        self._jobinfo = {}
+        # changes with the file list, clients are only sent the metadata then
+        self.files_version = 0
         self.update()
 
     def laserhead_update(self):
         self.data.update(self.laserhead.state)
+        self.data["queue"] = self.jobqueue.state
 
     def update(self):
         """
         Updates wifi, file list and laserhead state information.
         """
         self.laserhead_update()
+        folder = CONFIG["webserver"]["job_folder"]
         try:
-            files = os.listdir(CONFIG["webserver"]["job_folder"])
+            files = [f for f in os.listdir(folder) if not f.startswith(".")]
         except OSError:
             files = []
 
+        if files != self.data.get("files"):
+            self.files_version += 1
+        for fname in files:
+            if fname not in self._jobinfo:
+                self._jobinfo[fname] = jobinfo.load(folder, fname)
+        self._jobinfo = {f: self._jobinfo[f] for f in files}
+
         dct = {
             "files": files,
             "wifi": {
@@ -102,13 +124,27 @@ class DeviceState:
         }
         self.data.update(dct)
 
+    def set_jobinfo(self, fname, meta):
+        self._jobinfo[fname] = meta
+        self.files_version += 1
+
+    def message(self, version=None):
+        """
+        State sent to a client, with the job metadata unless the client
+        received it at ``version`` of the file list.
+        """
+        if version == self.files_version:
+            return self.data
+        return dict(self.data, jobinfo=self._jobinfo)
+
 
 # Configure Microdot
 app = Microdot()
 Session(app, secret_key=CONFIG["webserver"]["salt"])
 Response.default_content_type = "text/html"
 Request.max_content_length = CONFIG["webserver"]["max_content_length"] * 1024 * 1024
-devicestate = DeviceState(laserhead)
+jobqueue = JobQueue(QUEUE_FILE)
+devicestate = DeviceState(laserhead, jobqueue)
 
 # --- AUTHENTICATION MIDDLEWARE ---
 
@@ -137,6 +173,7 @@ async def authenticate(request, session):
             "/deletefile",
             "/reset",
             "/clearerror",
+            "/api/metrics",
         )
         if request.path.startswith(api_paths):
             return {"error": "Unauthorized"}, 401
@@ -196,7 +233,7 @@ async def upload(request, session):
 
     # Note: iterating os.stat is still slow, but unavoidable without a cached counter.
     try:
-        files = os.listdir(folder)
+        files = [f for f in os.listdir(folder) if not f.startswith(".")]
         current_usage_mb = sum(os.stat(f"{folder}/{f}")[6] for f in files) / (
             1024 * 1024
         )
@@ -223,8 +260,15 @@ async def upload(request, session):
         return {"error": "Missing filename in Content-Disposition"}, 400
 
     filepath = laserhead.get_job_path(filename)
+    compiler = scan = None
 
     try:
+        if jobinfo.is_gcode(filename):
+            # G-code is compiled to its move list while it streams in
+            compiler = gcodefile.Compiler(gcodefile.compiled_path(filepath))
+        else:
+            # the header of a laser job is parsed while it streams in
+            scan = jobinfo.PatScanner(filename)
         with open(filepath, "wb") as f:  # noqa: ASYNC230, fine in micropython
             bytes_remaining = content_len
             chunk_size = 4096
@@ -236,12 +280,20 @@ async def upload(request, session):
                     raise OSError("Incomplete upload / Connection closed")
 
                 f.write(chunk)
+                if scan is not None:
+                    scan.feed(chunk)
+                if compiler is not None:
+                    compiler = compile_chunk(compiler, chunk)
                 bytes_remaining -= len(chunk)
 
+        if compiler is not None:
+            compiler = compile_chunk(compiler, None, filepath)
         logger.info(f"Upload complete: {filename} ({content_len} bytes)")
 
     except Exception as e:  # noqa: BLE001, capture everything just to be safe
         logger.error(f"Upload failed: {e}")
+        if compiler is not None:
+            compiler.abort()
         # Clean up: delete the partial file so it doesn't waste space
         try:
             os.remove(filepath)
@@ -250,10 +302,50 @@ async def upload(request, session):
 
         return {"error": "Upload failed", "details": str(e)}, 500
 
+    try:
+        if scan is not None:
+            # a version 1 job is scanned for blank lanes once, here
+            extents = await laserhead.scan_extents(filename)
+            singlefacet = CONFIG["defaultprint"]["singlefacet"]
+            meta = scan.result(laserhead.cfg, singlefacet, extents)
+        elif compiler is not None:
+            cfg = CONFIG["gcode"]
+            with gcodefile.open_moves(compiler.path) as moves:
+                meta = jobinfo.gcode_result(
+                    moves, cfg["arc_tolerance_mm"], cfg["merge_tolerance_mm"]
+                )
+        else:
+            meta = None
+    except Exception as e:  # noqa: BLE001, metadata is optional
+        logger.error(f"Cannot read metadata of {filename}: {e}")
+        meta = None
+    if meta is not None:
+        jobinfo.save(folder, filename, meta)
+    else:
+        jobinfo.remove(folder, filename)
+    devicestate.set_jobinfo(filename, meta)
     devicestate.update()
     return {"success": "upload succeeded"}, 200
 
 
+def compile_chunk(compiler, chunk, source=None):
+    """
+    Feeds an uploaded chunk to the G-code compiler, finishes the move list
+    of ``source`` without a chunk. Returns None if compiling failed, the
+    upload proceeds and the job is compiled when it is executed.
+    """
+    try:
+        if chunk is None:
+            compiler.finish(source)
+        else:
+            compiler.feed(chunk)
+    except Exception as e:  # noqa: BLE001, compiled again when executed
+        logger.error(f"Compiling during upload failed: {e}")
+        compiler.abort()
+        return None
+    return compiler
+
+
 @app.post("/deletefile")
 @with_session
 async def delete_file(request, session):
@@ -283,6 +375,8 @@ async def delete_file(request, session):
         except OSError:
             # Error 2 usually means No Such File
             return {"error": "File not found"}, 404
+        jobinfo.remove(CONFIG["webserver"]["job_folder"], filename)
+        gcodefile.remove(gcodefile.compiled_path(filepath))
 
         # Updates the file list for other connected clients)
         devicestate.update()
@@ -310,6 +404,7 @@ async def reset(req, session):
         await asyncio.sleep(1)
 
         logger.info("Rebooting ESP32S3")
+        laserhead.flush_position()
         machine.reset()
 
     asyncio.create_task(delayed_reset())
@@ -473,6 +568,46 @@ async def save_facet_means(request, session):
     return laserhead.state
 
 
+async def run_job(filename, is_gcode, resume=False, keep_spindle=False):
+    """Runs a laser or G-code job, meant to be started as a background task.
+
+    Returns True if the job completed, i.e. it was not stopped and no error
+    occurred.
+    """
+    try:
+        if is_gcode:
+            if CONFIG["defaultprint"]["home_before_print"]:
+                logger.info("Homing X and Y axes before G-code execution.")
+                await laserhead.home_axes([1, 1, 0])
+
+            await laserhead.execute_gcode(filename, keep_spindle=keep_spindle)
+        else:
+            await laserhead.print_loop(filename, resume=resume)
+    except Exception as e:  # noqa: BLE001, just for certainty
+        logger.error(f"Print job failed with exception: {e}")
+        await laserhead.set_error(str(e))
+        await laserhead.notify_listeners()
+    finally:
+        laserhead.flush_position()
+        devicestate.laserhead_update()
+    return not (laserhead.state["error_message"] or laserhead.stop_requested)
+
+
+def job_settings(data, is_gcode):
+    """Returns the print settings of a job request for CONFIG["defaultprint"]."""
+    settings = {
+        "workspace_origin": data["workspace_origin"],
+        "home_before_print": bool(data["home_before_print"]),
+        "use_custom_start": bool(data["use_custom_start"]),
+    }
+    if not is_gcode:
+        settings["laserpower"] = int(data["laserpower"])
+        settings["exposureperline"] = int(data["exposureperline"])
+        settings["singlefacet"] = bool(data["singlefacet"])
+        settings["lanewidth_correction"] = float(data["lanewidth_correction"])
+    return settings
+
+
 @app.post("/print/control")
 @with_session
 async def print_control(request, session):
@@ -481,7 +616,7 @@ async def print_control(request, session):
     action = data["action"]
 
     if action == "start":
-        if laserhead.state["printing"]:
+        if laserhead.state["printing"] or jobqueue.running:
             return {"error": "Already printing"}, 409
 
         # Reset any previous error state
@@ -491,41 +626,28 @@ async def print_control(request, session):
         filename = data["file"].replace("/", "_")
 
         # Determine job type based on file extension
-        is_gcode = filename.lower().endswith((".gcode", ".nc", ".tap"))
+        is_gcode = jobinfo.is_gcode(filename)
 
-        cfg_print = CONFIG["defaultprint"]
-        if not is_gcode:
-            cfg_print["laserpower"] = int(data["laserpower"])
-            cfg_print["exposureperline"] = int(data["exposureperline"])
-            cfg_print["singlefacet"] = bool(data["singlefacet"])
-            cfg_print["lanewidth_correction"] = float(data["lanewidth_correction"])
+        CONFIG["defaultprint"].update(job_settings(data, is_gcode))
+        update_config()
 
-        # Shared settings
-        cfg_print["workspace_origin"] = data["workspace_origin"]
-        cfg_print["home_before_print"] = bool(data["home_before_print"])
-        cfg_print["use_custom_start"] = bool(data["use_custom_start"])
+        # Start background task
+        asyncio.create_task(run_job(filename, is_gcode))
 
+    elif action == "resume":
+        if laserhead.state["printing"] or jobqueue.running:
+            return {"error": "Already printing"}, 409
+
+        checkpoint = laserhead.load_checkpoint()
+        if checkpoint is None:
+            return {"error": "No interrupted job to resume"}, 400
+
+        laserhead.state["error_message"] = None
+        # Continue with the settings the job was started with
+        CONFIG["defaultprint"].update(checkpoint["settings"])
         update_config()
 
-        # Start background task
-        async def run_job():
-            try:
-                if is_gcode:
-                    if cfg_print["home_before_print"]:
-                        logger.info("Homing X and Y axes before G-code execution.")
-                        await laserhead.home_axes([1, 1, 0])
-
-                    await laserhead.execute_gcode(filename)
-                else:
-                    await laserhead.print_loop(filename)
-            except Exception as e:  # noqa: BLE001, just for certainty
-                logger.error(f"Print job failed with exception: {e}")
-                await laserhead.set_error(str(e))
-                await laserhead.notify_listeners()
-            finally:
-                devicestate.laserhead_update()
-
-        asyncio.create_task(run_job())
+        asyncio.create_task(run_job(checkpoint["filename"], False, resume=True))
 
     elif action == "stop":
         await laserhead.stop_print()
@@ -537,6 +659,95 @@ async def print_control(request, session):
     return devicestate.data
 
 
+queue_task = None
+
+
+async def run_queue():
+    """Executes queued jobs back to back until the queue is empty or held.
+
+    Neighbouring jobs of the same type share their set-up: a job following
+    a completed one skips homing, a laser job finds the scan head in
+    standby and G-code jobs leave the spindle running for their follower.
+    A job leaves the queue once it has completed, so a job interrupted by
+    a reboot is still queued. The queue is held if a job is stopped or
+    fails, the job stays queued.
+    """
+    previous = None
+    spinning = False
+    while jobqueue.running:
+        job = jobqueue.peek()
+        if job is None:
+            break
+        if spinning and not job["gcode"]:
+            await laserhead.set_spindle(0)
+        following = jobqueue.following(job["id"])
+        cfg_print = CONFIG["defaultprint"]
+        defaults = dict(cfg_print)
+        cfg_print.update(job["settings"])
+        if previous is not None and previous["gcode"] == job["gcode"]:
+            # the previous job homed and ended at a known position
+            cfg_print["home_before_print"] = False
+        keep_spindle = job["gcode"] and following is not None and following["gcode"]
+        laserhead.state["error_message"] = None
+        logger.info(f"Starting queued job {job['id']}: {job['file']}.")
+        try:
+            completed = await run_job(
+                job["file"], job["gcode"], keep_spindle=keep_spindle
+            )
+        finally:
+            # queued settings do not replace the operator's defaults
+            cfg_print.update(defaults)
+        if completed:
+            jobqueue.cancel(job["id"])
+        else:
+            logger.warning(f"Job {job['id']} did not complete, holding queue.")
+            jobqueue.running = False
+        previous = job
+        spinning = keep_spindle
+    if spinning:
+        await laserhead.set_spindle(0)
+    jobqueue.running = False
+    await laserhead.notify_listeners()
+
+
+@app.post("/print/queue")
+@with_session
+async def print_queue(request, session):
+    """Adds, cancels, reorders, runs or holds queued jobs."""
+    global queue_task
+    data = request.json
+    action = data["action"]
+
+    if action == "add":
+        filename = data["file"].replace("/", "_")
+        is_gcode = jobinfo.is_gcode(filename)
+        jobqueue.add(filename, is_gcode, job_settings(data, is_gcode))
+
+    elif action == "cancel":
+        if not jobqueue.cancel(int(data["id"])):
+            return {"error": "Job is not queued"}, 404
+
+    elif action == "move":
+        if not jobqueue.move(int(data["id"]), data["position"]):
+            return {"error": "Job is not queued"}, 404
+
+    elif action == "run":
+        if laserhead.state["printing"] and not jobqueue.running:
+            return {"error": "Already printing"}, 409
+        jobqueue.running = True
+        # a held queue whose last job is still running continues by itself
+        if queue_task is None or queue_task.done():
+            queue_task = asyncio.create_task(run_queue())
+
+    elif action == "hold":
+        # the running job completes, the next one is not started
+        jobqueue.running = False
+
+    await laserhead.notify_listeners()
+    devicestate.laserhead_update()
+    return devicestate.data
+
+
 @app.post("/clearerror")
 @with_session
 async def clear_error_route(request, session):
@@ -551,7 +762,8 @@ async def clear_error_route(request, session):
 @with_session
 async def state(request, session, sse):
     # Send initial state immediately upon connection
-    await sse.send(devicestate.data)
+    version = devicestate.files_version
+    await sse.send(devicestate.message())
 
     while True:
         try:
@@ -559,8 +771,10 @@ async def state(request, session, sse):
             # This uses 0 CPU.
             await laserhead.statechange.wait()
             devicestate.laserhead_update()
-            # We woke up! Send the data.
-            await sse.send(devicestate.data, event="message")
+            # We woke up! Send the data, job metadata only if files changed.
+            message = devicestate.message(version)
+            version = devicestate.files_version
+            await sse.send(message, event="message")
             # YIELD to ensure the data actually goes out before we wait again
             await asyncio.sleep(0)
         except Exception as e:  # noqa: BLE001
@@ -568,6 +782,21 @@ async def state(request, session, sse):
             break
 
 
+@app.get("/api/metrics")
+@with_session
+async def get_metrics(request, session):
+    """
+    Exposes the hot-path counters and histograms of the laserhead.
+
+    Durations are in microseconds unless their name ends with another unit.
+    Pass ``?reset=1`` to clear them after reading, e.g. before a test job.
+    """
+    metrics = laserhead.metrics.snapshot()
+    if request.args.get("reset"):
+        laserhead.metrics.reset()
+    return metrics
+
+
 @app.get("/api/settings")
 @with_session
 async def get_settings(request, session):
@@ -674,7 +903,7 @@ async def api_factory_reset(request, session):
     logger.warning("FACTORY RESET TARGETED! Wiping configuration...")
 
     # Delete active mutable configuration JSONs
-    for file_path in (CONFIG_FILE, NVS_FILE):
+    for file_path in (CONFIG_FILE, NVS_FILE, CHECKPOINT_FILE, QUEUE_FILE):
         try:
             os.remove(file_path)
             logger.info(f"Deleted {file_path}")
@@ -10,6 +10,7 @@ Usage (in base.py)::
 
     with deflate.DeflateIO(f, deflate.ZLIB) as d:
         data = d.read(n)
+        d.readinto(buf)
 """
 
 import zlib
@@ -17,12 +18,20 @@ import zlib
 # Match MicroPython's ``deflate.ZLIB`` constant
 ZLIB = 2
 
+# Compressed bytes read from the underlying stream per refill
+READ_SIZE = 4096
+# Upper bound on decompressed bytes held at once, all-zero scanlines
+# compress extremely well and would otherwise inflate to megabytes
+MAX_BLOCK = 64 * 1024
+
 
 class DeflateIO:
     """Streaming ZLIB decompressor that wraps a binary file object.
 
-    Provides a file-like ``read(n)`` interface identical to
-    MicroPython's ``deflate.DeflateIO``.
+    Provides the file-like ``read(n)`` and ``readinto(buf)`` interface of
+    MicroPython's ``deflate.DeflateIO``.  Decompressed data is kept as a
+    single block with a read offset, so every byte is copied once into the
+    caller's buffer irrespective of the read size.
     """
 
     def __init__(self, stream, fmt=ZLIB):
@@ -31,35 +40,67 @@ class DeflateIO:
         self._stream = stream
         # wbits=15 for ZLIB header
         self._decompressor = zlib.decompressobj(15)
-        self._buffer = b""
+        self._block = memoryview(b"")
+        self._pos = 0
 
-    def read(self, n=-1):
-        """Read *n* decompressed bytes.  Reads compressed chunks from the
-        underlying stream as needed."""
-        if n < 0:
-            # Read everything
-            chunks = [self._buffer]
-            while True:
-                raw = self._stream.read(4096)
+    def _refill(self):
+        """Replace the exhausted block with the next decompressed one.
+
+        Returns ``False`` at the end of the compressed stream.
+        """
+        d = self._decompressor
+        while True:
+            if d.unconsumed_tail:
+                data = d.decompress(d.unconsumed_tail, MAX_BLOCK)
+            else:
+                raw = self._stream.read(READ_SIZE)
                 if not raw:
+                    # End of compressed stream — flush remaining
+                    data = d.flush()
+                    if not data:
+                        return False
+                else:
+                    data = d.decompress(raw, MAX_BLOCK)
+            if data:
+                self._block = memoryview(data)
+                self._pos = 0
+                return True
+
+    def readinto(self, buf):
+        """Decompress into *buf* until it is full or the stream ends.
+
+        Returns the number of bytes written.
+        """
+        out = memoryview(buf).cast("B")
+        n = len(out)
+        got = 0
+        while got < n:
+            avail = len(self._block) - self._pos
+            if not avail:
+                if not self._refill():
+                    break
+                avail = len(self._block)
+            take = min(n - got, avail)
+            out[got : got + take] = self._block[self._pos : self._pos + take]
+            self._pos += take
+            got += take
+        return got
+
+    def read(self, n=-1):
+        """Read *n* decompressed bytes, or everything if *n* is negative."""
+        chunks = []
+        while n != 0:
+            avail = len(self._block) - self._pos
+            if not avail:
+                if not self._refill():
                     break
-                chunks.append(self._decompressor.decompress(raw))
-            chunks.append(self._decompressor.flush())
-            self._buffer = b""
-            return b"".join(chunks)
-
-        # Read exactly n bytes
-        while len(self._buffer) < n:
-            raw = self._stream.read(4096)
-            if not raw:
-                # End of compressed stream — flush remaining
-                self._buffer += self._decompressor.flush()
-                break
-            self._buffer += self._decompressor.decompress(raw)
-
-        result = self._buffer[:n]
-        self._buffer = self._buffer[n:]
-        return result
+                avail = len(self._block)
+            take = avail if n < 0 else min(n, avail)
+            chunks.append(self._block[self._pos : self._pos + take])
+            self._pos += take
+            if n > 0:
+                n -= take
+        return b"".join(chunks)
 
     def __enter__(self):
         return self
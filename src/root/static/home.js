@@ -11,12 +11,49 @@
  * @property {number} currentline - Current line number
  * @property {number} totallines - Total lines in file
  * @property {number} printingtime - Elapsed time in seconds
+ * @property {number|null} [estimatedtime] - Planned duration in seconds
+ * @property {number|null} [remainingtime] - Remaining time in seconds, refined while printing
  * @property {number} exposureperline - Exposure count
  * @property {number} laserpower - Laser power level
  * @property {boolean} singlefacet - Whether single facet mode is on
  * @property {number[]} workspace_origin - The [x, y, z] starting offset vector
  */
 
+/**
+ * @typedef {Object} Checkpoint
+ * @property {string} filename - Laser job that was interrupted
+ * @property {number} lane - Next lane to expose (0-based)
+ * @property {number} lanes - Total lanes in the job
+ */
+
+/**
+ * @typedef {Object} QueuedJob
+ * @property {number} id - Queue entry id
+ * @property {string} file - Job file
+ * @property {boolean} gcode - Whether it is a G-code job
+ * @property {Object} settings - Print settings the job was queued with
+ */
+
+/**
+ * @typedef {Object} JobQueue
+ * @property {boolean} running - Whether queued jobs are executed
+ * @property {QueuedJob[]} jobs - Jobs waiting to be executed, in order
+ */
+
+/**
+ * @typedef {Object} JobInfo
+ * @property {string} type - "laser" or "gcode"
+ * @property {number} [lanes] - Number of lanes of a laser job
+ * @property {number} [facets_lane] - Scanlines per lane
+ * @property {number} [lane_width] - Lane width in mm
+ * @property {number} [exposures] - Exposures per line
+ * @property {number} [moves] - Number of moves of a G-code job
+ * @property {number[]|null} bbox - Exposed area [xmin, ymin, xmax, ymax] in mm
+ * @property {number[]|null} [z] - Depth range [zmin, zmax] in mm of a G-code job
+ * @property {boolean} [halted] - A G-code job stops at an unsupported command
+ * @property {number} duration - Estimated duration in seconds
+ */
+
 /**
  * @typedef {Object} Components
  * @property {boolean} rotating - Is the motor turning?
@@ -33,6 +70,9 @@
  * @property {boolean} [estop] - Is the machine in emergency stop state?
  * @property {PrintJob} job - The current job details
  * @property {Components} components - Hardware status
+ * @property {Checkpoint|null} [checkpoint] - Resumable interrupted laser job
+ * @property {JobQueue} [queue] - Jobs queued for back-to-back execution
+ * @property {Object<string, JobInfo|null>} [jobinfo] - Metadata per job file
  * @property {number[]} mpos - Machine position mm [x, y, z]
  * @property {number[]} wpos - Workspace position mm [x, y, z]
  * @property {number} [notauthorized] - Optional flag if session is invalid
@@ -129,11 +169,30 @@ document.addEventListener("alpine:init", () => {
             fan: 0
         },
         error_message: null,
+        /** @type {Checkpoint|null} */
+        checkpoint: null,
+        /** @type {JobQueue} */
+        queue: { running: false, jobs: [] },
+        /** @type {Object<string, JobInfo|null>} */
+        jobinfo: {},
         mpos: [0.00, 0.00, 0.00], // machine position in mm
         wpos: [0.00, 0.00, 0.00], // workspace position in mm
 
         estimatedRemainingTime: 'Calculating...',
 
+        /**
+         * Formats a duration as h:mm:ss or mm:ss
+         * @param {number} seconds - Duration in seconds
+         * @returns {string}
+         */
+        formatDuration(seconds) {
+            const hours = Math.floor(seconds / 3600);
+            const mins = Math.floor((seconds % 3600) / 60);
+            const secs = seconds % 60;
+            const pad = (/** @type {number} */ n) => String(n).padStart(2, '0');
+            return hours > 0 ? `${hours}:${pad(mins)}:${pad(secs)}` : `${pad(mins)}:${pad(secs)}`;
+        },
+
         /**
          * Updates the store with data from the server
          * @param {MachineState} data - The JSON object from the backend
@@ -163,17 +222,18 @@ document.addEventListener("alpine:init", () => {
             this.paused = data.paused || false;
             this.estop = data.estop || false;
             this.job = data.job;
+            this.checkpoint = data.checkpoint || null;
+            this.queue = data.queue || { running: false, jobs: [] };
+            if (data.jobinfo) this.jobinfo = data.jobinfo;
             this.mpos = data.mpos;
             this.wpos = data.wpos;
 
-            if (this.job && this.job.currentline >= 50 && this.job.totallines && this.job.printingtime > 0) {
+            if (this.job && this.job.remainingtime != null) {
+                this.estimatedRemainingTime = this.formatDuration(this.job.remainingtime);
+            } else if (this.job && this.job.currentline >= 50 && this.job.totallines && this.job.printingtime > 0) {
                 const timePerLine = this.job.printingtime / this.job.currentline;
                 const remainingSec = Math.max(0, Math.round((this.job.totallines - this.job.currentline) * timePerLine));
-                const hours = Math.floor(remainingSec / 3600);
-                const mins = Math.floor((remainingSec % 3600) / 60);
-                const secs = remainingSec % 60;
-                const pad = (/** @type {number} */ n) => String(n).padStart(2, '0');
-                this.estimatedRemainingTime = hours > 0 ? `${hours}:${pad(mins)}:${pad(secs)}` : `${pad(mins)}:${pad(secs)}`;
+                this.estimatedRemainingTime = this.formatDuration(remainingSec);
             } else {
                 this.estimatedRemainingTime = 'Calculating...';
             }
@@ -278,6 +338,18 @@ document.addEventListener("alpine:init", () => {
 
         stopPrint() { api.post('/print/control', { action: 'stop' }); },
         pausePrint() { api.post('/print/control', { action: 'pause' }); },
+        resumePrint() { api.post('/print/control', { action: 'resume' }); },
+        runQueue() { api.post('/print/queue', { action: 'run' }); },
+        holdQueue() { api.post('/print/queue', { action: 'hold' }); },
+
+        /** @param {number} id */
+        cancelQueued(id) { api.post('/print/queue', { action: 'cancel', id: id }); },
+
+        /**
+         * @param {number} id
+         * @param {number} position - New 0-based position in the queue
+         */
+        moveQueued(id, position) { api.post('/print/queue', { action: 'move', id: id, position: position }); },
 
         // Reboot state & handlers
         rebooting: false,
@@ -574,7 +646,11 @@ document.addEventListener("alpine:init", () => {
             }
         },
 
-        async startPrint() {
+        /**
+         * Starts the selected job or adds it to the queue
+         * @param {'start' | 'add'} [action='start']
+         */
+        async startPrint(action = 'start') {
             if (!this.selectedFile) {
                 alert("Please select a file.");
                 return;
@@ -584,7 +660,7 @@ document.addEventListener("alpine:init", () => {
 
             try {
                 const payload = {
-                    action: 'start',
+                    action: action,
                     file: this.selectedFile,
                     laserpower: Number(this.laserPower),
                     exposureperline: Number(this.exposure),
@@ -599,7 +675,8 @@ document.addEventListener("alpine:init", () => {
                     ]
                 };
 
-                const res = await fetch('/print/control', {
+                const url = action === 'add' ? '/print/queue' : '/print/control';
+                const res = await fetch(url, {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify(payload)
@@ -0,0 +1,42 @@
+import io
+import zlib
+
+import pytest
+
+import deflate
+
+
+@pytest.fixture
+def payload():
+    # mix of compressible blank scanlines and noisy data
+    return bytes(200_000) + bytes(i * 7 % 251 for i in range(50_000))
+
+
+def test_read_small_chunks(payload):
+    d = deflate.DeflateIO(io.BytesIO(zlib.compress(payload)), deflate.ZLIB)
+    chunks = []
+    while chunk := d.read(37):
+        chunks.append(chunk)
+    assert b"".join(chunks) == payload
+
+
+def test_read_all(payload):
+    d = deflate.DeflateIO(io.BytesIO(zlib.compress(payload)), deflate.ZLIB)
+    assert d.read(12) == payload[:12]
+    assert d.read() == payload[12:]
+    assert d.read(10) == b""
+
+
+def test_readinto(payload):
+    d = deflate.DeflateIO(io.BytesIO(zlib.compress(payload)), deflate.ZLIB)
+    buf = bytearray(100_000)
+    view = memoryview(buf)
+    out = bytearray()
+    while n := d.readinto(view[:99_999]):
+        out += view[:n]
+    assert out == payload
+
+
+def test_unsupported_format():
+    with pytest.raises(ValueError):
+        deflate.DeflateIO(io.BytesIO(b""), 1)
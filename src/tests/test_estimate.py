@@ -0,0 +1,24 @@
+from types import SimpleNamespace
+
+from control.laserhead.estimate import Estimate, lane_times
+
+
+def test_lane_times():
+    cfg = SimpleNamespace(
+        laser_timing={"rpm": 60, "facets": 4},
+        motor_cfg={"orth2lsrline": "x", "steps_mm": {"x": 10}},
+    )
+    # 4 lines of 0.25 s, the blank lane takes no time
+    times = lane_times(cfg, [(0, 4), (0, 0)], 4, 2.0, 1)
+    assert times == [1.0, 0.0]
+    # single facet uses one facet per revolution, both exposures are sent
+    times = lane_times(cfg, [(0, 4)], 4, 2.0, 2, singlefacet=True)
+    assert times == [8.0]
+
+
+def test_remaining():
+    estimate = Estimate(100.0)
+    # the plan is used until enough work is done to measure
+    assert estimate.remaining(1.0, 5.0) == 99
+    # measured twice as slow as planned
+    assert estimate.remaining(10.0, 20.0) == 180
@@ -0,0 +1,103 @@
+import math
+import os
+
+import pytest
+
+from control.laserhead import gcodefile
+from control.laserhead.arcs import MIN_TOLERANCE, chords, segments
+from control.laserhead.estimate import RAPID_SPEED
+
+
+def write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def test_compile(tmp_path):
+    source = f"{tmp_path}/job.gcode"
+    write(source, "G90\nG0 X10 ; rapid\nM3 S300\nG1 Y5 F60\nG91\nG1 X-20\nM5\nG20")
+    with gcodefile.load(source) as moves:
+        assert moves.records == 6
+        resolved = [
+            (op, list(target), speed, spindle)
+            for op, target, speed, spindle, _ in moves.moves([0.0, 0.0, 1.0], 0.01)
+        ]
+    assert resolved == [
+        (gcodefile.OP_MOVE, [10.0, 0.0, 1.0], RAPID_SPEED, 0),
+        # spindle values are clamped to the PWM range
+        (gcodefile.OP_SPINDLE, [10.0, 0.0, 1.0], 0.0, 255),
+        (gcodefile.OP_MOVE, [10.0, 5.0, 1.0], 1.0, 0),
+        (gcodefile.OP_MOVE, [-10.0, 5.0, 1.0], 1.0, 0),
+        (gcodefile.OP_SPINDLE, [-10.0, 5.0, 1.0], 0.0, 0),
+        (gcodefile.OP_HALT, [-10.0, 5.0, 1.0], 0.0, 0),
+    ]
+
+
+def test_cache(tmp_path):
+    source = f"{tmp_path}/job.gcode"
+    write(source, "G0 X1\n")
+    with gcodefile.load(source):
+        pass
+    path = gcodefile.compiled_path(source)
+    assert path == f"{tmp_path}/.meta/job.gcode.bin"
+    # an unchanged source reuses the move list
+    os.utime(path, (0, 0))
+    with gcodefile.load(source) as moves:
+        assert moves.records == 1
+    assert os.stat(path).st_mtime == 0
+    write(source, "G0 X1\nG0 X2\n")
+    with gcodefile.load(source) as moves:
+        assert moves.records == 2
+
+
+def test_arcs(tmp_path):
+    source = f"{tmp_path}/arc.gcode"
+    # a counterclockwise quarter circle and a clockwise full circle around
+    # the origin, arcs given by a radius are not supported
+    write(source, "G0 X10\nG3 X0 Y10 I-10 J0 F600\nG2 I0 J-10\nG2 X1 R5")
+    with gcodefile.load(source) as moves:
+        assert moves.records == 4
+        resolved = [
+            (op, list(target), duration)
+            for op, target, _, _, duration in moves.moves([0.0, 0.0, 0.0], 0.01)
+        ]
+    assert resolved.pop()[0] == gcodefile.OP_HALT
+    chords = resolved[1:]
+    assert len(chords) > 2
+    for op, target, _ in chords:
+        assert op == gcodefile.OP_MOVE
+        assert math.hypot(target[0], target[1]) == pytest.approx(10)
+    assert chords[-1][1] == [0.0, 10.0, 0.0]
+    # 1.25 circumferences at 10 mm/s, the chords are slightly shorter
+    duration = sum(duration for _, _, duration in chords)
+    assert duration == pytest.approx(2.5 * math.pi, rel=1e-3)
+
+
+def test_optimizer(tmp_path):
+    source = f"{tmp_path}/line.gcode"
+    # collinear moves, a repeated spindle command and a move without axes
+    write(source, "M3 S200\nM3 S200\nG1 X1 F60\nG1 X2\nG1 X3 Y0.0005\nG1\nG1 X3 Y1")
+    with gcodefile.load(source) as moves:
+        optimizer = gcodefile.Optimizer(
+            moves.moves([0.0, 0.0, 0.0], 0.01), [0.0, 0.0, 0.0], 0.001, 0
+        )
+        resolved = [
+            (op, list(target), duration) for op, target, _, _, duration in optimizer
+        ]
+    assert resolved == [
+        (gcodefile.OP_SPINDLE, [0.0, 0.0, 0.0], 0.0),
+        (gcodefile.OP_MOVE, pytest.approx([3.0, 0.0005, 0.0]), pytest.approx(3.0)),
+        (gcodefile.OP_MOVE, [3.0, 1.0, 0.0], pytest.approx(0.9995)),
+    ]
+    assert optimizer.removed == 4
+
+
+def test_arc_tolerance():
+    # a zero tolerance is raised to the smallest one
+    assert segments(10.0, math.pi, 0.0) == segments(10.0, math.pi, MIN_TOLERANCE)
+    assert segments(10.0, math.pi, 0.0) > segments(10.0, math.pi, 0.01)
+    # tolerances reaching the radius or beyond give a single chord
+    for tolerance in (1.0, 2.0, 5.0):
+        assert segments(1.0, math.pi, tolerance) == 1
+    points = chords([1.0, 0.0, 0.0], [-1.0, 0.0, 0.0], (-1.0, 0.0), True, 5.0)
+    assert points == [[-1.0, 0.0, 0.0]]
@@ -0,0 +1,107 @@
+import io
+import struct
+import zlib
+
+import pytest
+
+from control.laserhead.jobfile import LaserJob, write_job
+
+LINE_BYTES = 36
+FACETS_LANE = 20
+LANES = 3
+
+
+@pytest.fixture
+def lanes_data():
+    lane_bytes = FACETS_LANE * LINE_BYTES
+    return [bytes((lane + i) % 256 for i in range(lane_bytes)) for lane in range(LANES)]
+
+
+@pytest.fixture
+def job_v1(lanes_data):
+    header = struct.pack("<fII", 2.5, FACETS_LANE, LANES)
+    return io.BytesIO(zlib.compress(header + b"".join(lanes_data)))
+
+
+@pytest.fixture
+def job_v2(lanes_data):
+    f = io.BytesIO()
+    write_job(f, lanes_data, 2.5, FACETS_LANE, exposures=4, optical_correction=True)
+    f.seek(0)
+    return f
+
+
+def read_lane(job, lane):
+    buf = bytearray(FACETS_LANE * LINE_BYTES)
+    job.stream_at(lane, 0, LINE_BYTES).readinto(buf)
+    return bytes(buf)
+
+
+def test_header(job_v1, job_v2):
+    v1 = LaserJob(job_v1).header()
+    v2 = LaserJob(job_v2).header()
+    assert v1["version"] == 1
+    assert v1["exposures"] is None
+    assert v2["version"] == 2
+    assert v2["exposures"] == 4
+    assert v2["optical_correction"] is True
+    for key in ("lane_width", "facets_lane", "lanes"):
+        assert v1[key] == v2[key]
+
+
+def test_random_lane_access(job_v2, lanes_data):
+    job = LaserJob(job_v2)
+    for lane in (2, 0, 1):
+        assert read_lane(job, lane) == lanes_data[lane]
+
+
+def test_sequential_skip(job_v1, lanes_data):
+    job = LaserJob(job_v1)
+    assert read_lane(job, 1) == lanes_data[1]
+    with pytest.raises(ValueError):
+        read_lane(job, 0)
+
+
+def test_chunks(job_v1, job_v2, lanes_data):
+    for f in (job_v1, job_v2):
+        job = LaserJob(f)
+        data = bytearray()
+        for stream, size in job.chunks(7, LINE_BYTES, start_lane=1):
+            buf = bytearray(size)
+            assert stream.readinto(buf) == size
+            data += buf
+        assert data == b"".join(lanes_data[1:])
+
+
+def test_extents(lanes_data):
+    blank = bytes(LINE_BYTES)
+    sparse = bytearray(FACETS_LANE * LINE_BYTES)
+    sparse[5 * LINE_BYTES + 10] = 1
+    sparse[12 * LINE_BYTES + 30] = 1
+    # only the header bytes of this line differ from a blank line
+    sparse[15 * LINE_BYTES] = 1
+    data = [sparse, bytes(len(sparse)), lanes_data[2]]
+    v1 = io.BytesIO(
+        zlib.compress(struct.pack("<fII", 2.5, FACETS_LANE, LANES) + b"".join(data))
+    )
+    v2 = io.BytesIO()
+    write_job(v2, data, 2.5, FACETS_LANE, blank_line=blank, header_bytes=9)
+    v2.seek(0)
+    expected = [(5, 13), (0, 0), (0, FACETS_LANE)]
+    assert LaserJob(v1).extents(LINE_BYTES, blank, 9) == expected
+    job = LaserJob(v2)
+    assert job.extents(LINE_BYTES, blank, 9) == expected
+    out = bytearray()
+    for stream, size in job.chunks(3, LINE_BYTES, extents=expected):
+        buf = bytearray(size)
+        stream.readinto(buf)
+        out += buf
+    assert out == sparse[5 * LINE_BYTES : 13 * LINE_BYTES] + lanes_data[2]
+
+
+def test_corrupt_lane(job_v2):
+    raw = bytearray(job_v2.getvalue())
+    raw[-5] ^= 0xFF
+    job = LaserJob(io.BytesIO(raw))
+    with pytest.raises(ValueError, match="CRC"):
+        read_lane(job, LANES - 1)
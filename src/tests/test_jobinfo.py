@@ -0,0 +1,146 @@
+import asyncio
+import io
+import math
+import os
+import struct
+import zlib
+from types import SimpleNamespace
+
+import pytest
+
+from control import jobinfo
+from control.laserhead import gcodefile
+from control.laserhead.estimate import RAPID_SPEED
+from control.laserhead.jobfile import write_job
+
+LINE_BYTES = 4
+FACETS_LANE = 10
+
+
+@pytest.fixture
+def cfg():
+    return SimpleNamespace(
+        laser_timing={"rpm": 60, "facets": 1},
+        motor_cfg={"orth2lsrline": "x", "steps_mm": {"x": 100}},
+    )
+
+
+def feed(scan, data, size=7):
+    for offset in range(0, len(data), size):
+        scan.feed(data[offset : offset + size])
+
+
+def test_laser_job(cfg):
+    blank = bytes(LINE_BYTES)
+    lane = bytearray(FACETS_LANE * LINE_BYTES)
+    lane[2 * LINE_BYTES : 6 * LINE_BYTES] = b"\xff" * 4 * LINE_BYTES
+    f = io.BytesIO()
+    write_job(f, [lane, bytes(lane)], 2.5, FACETS_LANE, blank_line=blank)
+    v1 = zlib.compress(struct.pack("<fII", 2.5, FACETS_LANE, 2) + bytes(2 * lane))
+
+    scan = jobinfo.PatScanner("job.pat")
+    feed(scan, f.getvalue())
+    meta = scan.result(cfg)
+    assert meta["lanes"] == 2
+    assert meta["lines"] == 8
+    # 8 lines of 1 s and the move to the second lane
+    assert meta["duration"] == 8
+    # the second lane is exposed in reverse
+    assert meta["bbox"] == [0.02, 0.0, 0.08, 5.0]
+
+    scan = jobinfo.PatScanner("job_e2_nocor.pat")
+    feed(scan, v1)
+    meta = scan.result(cfg, singlefacet=False)
+    assert meta["version"] == 1
+    assert meta["exposures"] == 2
+    assert meta["lines"] == 2 * FACETS_LANE
+    assert meta["duration"] == 2 * 2 * FACETS_LANE
+
+
+def gcode_meta(tmp_path, text, arc_tolerance=0.002):
+    source = str(tmp_path / "job.gcode")
+    with open(source, "w") as f:
+        f.write(text)
+    with gcodefile.load(source) as moves:
+        return jobinfo.gcode_result(moves, arc_tolerance, 0.001)
+
+
+def test_gcode_job(tmp_path):
+    meta = gcode_meta(tmp_path, "G90\nG0 X10 ; rapid\nG1 Y5 F60\nG91\nG1 X-20 Z-1")
+    assert meta["moves"] == 3
+    assert meta["bbox"] == [-10.0, 0.0, 10.0, 5.0]
+    assert meta["z"] == [-1.0, 0.0]
+    assert not meta["halted"]
+    # 10 mm rapid, 5 mm and the 20 mm diagonal at 1 mm/s
+    assert meta["duration"] == round(10 / RAPID_SPEED + 5 + math.sqrt(401))
+
+
+def test_gcode_halt(tmp_path):
+    # execution stops at inches and at arcs given by a radius
+    for halt in ("G20", "G2 X0 R5"):
+        meta = gcode_meta(tmp_path, f"G1 X10 F600\n{halt}\nG1 X100\n")
+        assert meta["halted"]
+        assert meta["moves"] == 1
+        assert meta["bbox"] == [10.0, 0.0, 10.0, 0.0]
+
+
+def test_gcode_arc(tmp_path):
+    # a half circle around the origin, split with the configured tolerance
+    text = "G0 X10\nG2 X-10 I-10 F600\n"
+    meta = gcode_meta(tmp_path, text)
+    assert meta["bbox"][1] == pytest.approx(-10.0, abs=0.01)
+    coarse = gcode_meta(tmp_path, text, arc_tolerance=1.0)
+    assert coarse["moves"] < meta["moves"]
+
+
+def test_state_messages(tmp_path, monkeypatch):
+    from control import webapp
+    from control.constants import CONFIG
+
+    monkeypatch.setitem(CONFIG["webserver"], "job_folder", str(tmp_path))
+    (tmp_path / "a.gcode").write_text("G0 X1\n")
+    state = webapp.DeviceState(webapp.laserhead, webapp.jobqueue)
+    version = state.files_version
+    assert "a.gcode" in state.message()["jobinfo"]
+    # state changes do not resend the metadata
+    state.laserhead_update()
+    state.update()
+    assert "jobinfo" not in state.message(version)
+    (tmp_path / "b.gcode").write_text("G0 X1\n")
+    state.update()
+    assert set(state.message(version)["jobinfo"]) == {"a.gcode", "b.gcode"}
+    version = state.files_version
+    state.set_jobinfo("b.gcode", None)
+    assert state.message(version)["jobinfo"]["b.gcode"] is None
+
+
+def test_upload_compile_error(tmp_path, monkeypatch):
+    from control import webapp
+    from control.constants import CONFIG
+    from microdot.test_client import TestClient
+
+    monkeypatch.setitem(CONFIG["webserver"], "job_folder", str(tmp_path))
+    monkeypatch.setattr(webapp, "is_authorized", lambda session: True)
+
+    def fail(self, chunk):
+        raise ValueError("cannot compile")
+
+    monkeypatch.setattr(gcodefile.Compiler, "feed", fail)
+
+    async def upload():
+        client = TestClient(webapp.app)
+        return await client.post(
+            "/upload",
+            headers={"Content-Disposition": 'attachment; filename="job.gcode"'},
+            body=b"G1 X1 F60\n",
+        )
+
+    # the job is kept and compiled when it is executed
+    assert asyncio.run(upload()).status_code == 200
+    assert (tmp_path / "job.gcode").read_text() == "G1 X1 F60\n"
+    source = str(tmp_path / "job.gcode")
+    assert not os.path.exists(gcodefile.compiled_path(source))
+    assert jobinfo.load(str(tmp_path), "job.gcode") is None
+    monkeypatch.undo()
+    with gcodefile.load(source) as moves:
+        assert moves.records == 1
@@ -0,0 +1,142 @@
+import asyncio
+import struct
+import zlib
+
+import pytest
+
+from control.jobqueue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.json"))
+    for name in ("a.pat", "b.gcode", "c.pat"):
+        queue.add(name, name.endswith(".gcode"), {"laserpower": 100})
+    return queue
+
+
+def files(queue):
+    return [job["file"] for job in queue.jobs]
+
+
+def test_reorder_and_cancel(queue):
+    assert queue.move(3, 0)
+    assert files(queue) == ["c.pat", "a.pat", "b.gcode"]
+    assert queue.cancel(1)
+    assert files(queue) == ["c.pat", "b.gcode"]
+    assert not queue.cancel(1)
+    assert not queue.move(1, 0)
+
+
+def test_persistence(queue):
+    queue.cancel(1)
+    restored = JobQueue(queue.path)
+    assert files(restored) == ["b.gcode", "c.pat"]
+    assert not restored.running
+    # ids are not reused after a reboot
+    assert restored.add("d.pat", False, {})["id"] == 4
+
+
+def test_following(queue):
+    assert queue.following(1)["file"] == "b.gcode"
+    assert queue.following(3) is None
+    assert queue.following(7) is None
+
+
+@pytest.fixture
+def webapp(queue, tmp_path, monkeypatch):
+    from control import webapp
+    from control.laserhead import base
+
+    monkeypatch.setattr(webapp, "jobqueue", queue)
+    monkeypatch.setattr(webapp.devicestate, "jobqueue", queue)
+    monkeypatch.setattr(webapp, "is_authorized", lambda session: True)
+    monkeypatch.setattr(webapp, "update_config", lambda: None)
+    monkeypatch.setitem(webapp.CONFIG["webserver"], "job_folder", str(tmp_path))
+    monkeypatch.setattr(base, "CHECKPOINT_FILE", str(tmp_path / "checkpoint.json"))
+    webapp.laserhead.state["error_message"] = None
+    return webapp
+
+
+def fake_jobs(webapp, monkeypatch, failing=()):
+    """Replaces run_job, returns the runs with the files queued meanwhile."""
+    runs = []
+
+    async def run_job(filename, is_gcode, resume=False, keep_spindle=False):
+        runs.append((filename, keep_spindle, files(webapp.jobqueue)))
+        return filename not in failing
+
+    monkeypatch.setattr(webapp, "run_job", run_job)
+    return runs
+
+
+def test_run_queue(webapp, queue, monkeypatch):
+    queue.add("d.gcode", True, {})
+    runs = fake_jobs(webapp, monkeypatch, failing=("c.pat",))
+    queue.running = True
+    asyncio.run(webapp.run_queue())
+    # a job leaves the queue once it has completed, a failed job stays
+    assert runs == [
+        ("a.pat", False, ["a.pat", "b.gcode", "c.pat", "d.gcode"]),
+        ("b.gcode", False, ["b.gcode", "c.pat", "d.gcode"]),
+        ("c.pat", False, ["c.pat", "d.gcode"]),
+    ]
+    assert files(queue) == ["c.pat", "d.gcode"]
+    assert not queue.running
+    assert files(JobQueue(queue.path)) == ["c.pat", "d.gcode"]
+    # G-code jobs keep the spindle running for a following G-code job
+    queue.cancel(3)
+    queue.add("e.gcode", True, {})
+    runs.clear()
+    queue.running = True
+    asyncio.run(webapp.run_queue())
+    assert [(run[0], run[1]) for run in runs] == [
+        ("d.gcode", True),
+        ("e.gcode", False),
+    ]
+    assert queue.jobs == []
+
+
+def test_rejected_job(webapp, tmp_path, monkeypatch):
+    monkeypatch.setitem(webapp.CONFIG["defaultprint"], "exposureperline", 4)
+    # optical correction cannot be combined with multiple exposures
+    with open(tmp_path / "job_e1_cor.pat", "wb") as f:
+        f.write(zlib.compress(struct.pack("<fII", 0.1, 1, 1)))
+    assert not asyncio.run(webapp.run_job("job_e1_cor.pat", False))
+    assert not webapp.laserhead.state["printing"]
+    assert webapp.laserhead.state["error_message"]
+
+
+def test_queue_route(webapp, queue, monkeypatch):
+    from microdot.test_client import TestClient
+
+    runs = fake_jobs(webapp, monkeypatch)
+    settings = {
+        "workspace_origin": [0, 0, 0],
+        "home_before_print": False,
+        "use_custom_start": False,
+        "laserpower": 100,
+        "exposureperline": 1,
+        "singlefacet": False,
+        "lanewidth_correction": 0.0,
+    }
+
+    async def post(body):
+        client = TestClient(webapp.app)
+        return await client.post("/print/queue", body=body)
+
+    async def main():
+        res = await post({"action": "add", "file": "d/e.pat", **settings})
+        assert [job["file"] for job in res.json["queue"]["jobs"]][-1] == "d_e.pat"
+        res = await post({"action": "move", "id": 4, "position": 0})
+        assert res.json["queue"]["jobs"][0]["id"] == 4
+        assert (await post({"action": "cancel", "id": 2})).status_code == 200
+        assert (await post({"action": "cancel", "id": 2})).status_code == 404
+        await post({"action": "run"})
+        await webapp.queue_task
+        res = await post({"action": "hold"})
+        assert res.json["queue"] == {"jobs": [], "running": False}
+
+    asyncio.run(main())
+    assert [run[0] for run in runs] == ["d_e.pat", "a.pat", "c.pat"]
+    assert queue.jobs == []
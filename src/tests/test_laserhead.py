@@ -0,0 +1,538 @@
+import asyncio
+import copy
+import gc
+import itertools
+import os
+import struct
+import zlib
+
+import pytest
+from hexastorm.config import Spi
+
+from control import jobinfo
+from control.constants import CONFIG, NVS_STORE
+from control.laserhead import base, gcodefile
+from control.laserhead.base import BaseLaserhead
+from control.laserhead.jobfile import LaserJob, write_job
+
+
+@pytest.fixture
+def head(tmp_path, monkeypatch):
+    monkeypatch.setitem(CONFIG["webserver"], "job_folder", str(tmp_path))
+    monkeypatch.setattr(base, "CHECKPOINT_FILE", str(tmp_path / "checkpoint.json"))
+    monkeypatch.setattr(NVS_STORE, "mock_file", str(tmp_path / "nvs.json"))
+    for key, value in (
+        ("exposureperline", 1),
+        ("home_before_print", False),
+        ("use_custom_start", False),
+    ):
+        monkeypatch.setitem(CONFIG["defaultprint"], key, value)
+    monkeypatch.setitem(CONFIG["laserhead"], "standby_s", 0)
+    # chunks of lines_chunk lines, so a lane takes several chunks
+    monkeypatch.setitem(CONFIG["laserhead"], "max_chunk_factor", 1)
+    head = BaseLaserhead()
+    head._twin.speedup = 1000
+    # SPI transactions and the machine position while each was sent
+    head.sent = []
+    send = head.send_command
+
+    async def record(command, timeout=0):
+        head.sent.append((bytes(command), head.mpos))
+        return await send(command, timeout)
+
+    head.send_command = record
+    return head
+
+
+def line_bytes(head):
+    return head.cfg.hdl_cfg.words_scanline * (Spi.command_bytes + Spi.word_bytes)
+
+
+def make_job(head, fname, lanes=4, facets=None):
+    if facets is None:
+        facets = 4 * head.cfg.hdl_cfg.lines_chunk
+    size = facets * line_bytes(head)
+    data = [
+        bytes((lane + idx) % 251 + 1 for idx in range(size)) for lane in range(lanes)
+    ]
+    with open(head.get_job_path(fname), "wb") as f:
+        write_job(f, data, 0.1, facets)
+
+
+def sent_bytes(head):
+    return b"".join(data for data, _ in head.sent)
+
+
+def test_resume(head):
+    make_job(head, "job.pat")
+    asyncio.run(head.print_loop("job.pat"))
+    full = sent_bytes(head)
+    assert head.load_checkpoint() is None
+    head.sent.clear()
+
+    save = head._save_checkpoint
+
+    def interrupt(fname, lane, lanes):
+        save(fname, lane, lanes)
+        if lane == 2:
+            head._stop.set()
+
+    head._save_checkpoint = interrupt
+    asyncio.run(head.print_loop("job.pat"))
+    del head._save_checkpoint
+    checkpoint = head.load_checkpoint()
+    assert checkpoint["lane"] == 2
+    assert head.state["checkpoint"]["lane"] == 2
+
+    # the resumed job sends the lanes the interrupted one did not
+    asyncio.run(head.print_loop("job.pat", resume=True))
+    assert sent_bytes(head) == full
+    assert head.load_checkpoint() is None
+
+
+def test_stop_within_lane(head, monkeypatch):
+    monkeypatch.setitem(CONFIG["laserhead"], "progress_interval_ms", 0)
+    make_job(head, "job.pat")
+    lines_chunk = head.cfg.hdl_cfg.lines_chunk
+    chunk = lines_chunk * line_bytes(head)
+    send = head.send_command
+
+    async def stop_after_chunk(command, timeout=0):
+        await send(command, timeout)
+        if len(command) == chunk:
+            head._stop.set()
+
+    head.send_command = stop_after_chunk
+    asyncio.run(head.print_loop("job.pat"))
+    stop_line = head.blank_line()
+    data = [command for command, _ in head.sent if command != stop_line]
+    assert [len(command) for command in data] == [chunk]
+    # a single stop line follows, at the end of the lines that were sent
+    assert [command for command, _ in head.sent[1:]] == [stop_line]
+    scan_axis = head.cfg.motor_cfg["orth2lsrline"]
+    idx = "xyz".index(scan_axis)
+    mm_per_facet = 1 / head.cfg.motor_cfg["steps_mm"][scan_axis]
+    expected = head._work_offset[idx] + lines_chunk * mm_per_facet
+    assert head.sent[1][1][idx] == pytest.approx(expected)
+    assert head.load_checkpoint()["lane"] == 0
+
+
+def test_stop_within_chunk(head, monkeypatch):
+    # a chunk holds a whole lane, stops are handled between its transactions
+    monkeypatch.setitem(CONFIG["laserhead"], "max_chunk_factor", 64)
+    monkeypatch.setitem(CONFIG["laserhead"], "progress_interval_ms", 0)
+    monkeypatch.setitem(CONFIG["defaultprint"], "exposureperline", 4)
+    make_job(head, "job.pat")
+    send = head.send_command
+
+    async def stop_after_send(command, timeout=0):
+        await send(command, timeout)
+        head._stop.set()
+
+    head.send_command = stop_after_send
+    asyncio.run(head.print_loop("job.pat"))
+    sizes = [len(command) for command, _ in head.sent]
+    assert sizes == [4 * line_bytes(head), len(head.blank_line())]
+
+
+def make_v1_job(head, fname):
+    """Writes a version 1 job of two lanes, the first one is blank."""
+    lines = 4 * head.cfg.hdl_cfg.lines_chunk
+    size = line_bytes(head)
+    blank = head.blank_line(int(head.cfg.laser_timing["scanline_length"]))
+    data = struct.pack("<fII", 0.1, lines, 2) + blank[:size] * lines
+    data += bytes(range(1, size + 1)) * lines
+    with open(head.get_job_path(fname), "wb") as f:
+        f.write(zlib.compress(data))
+    return lines
+
+
+def test_adaptive_transactions(head, monkeypatch):
+    # chunks of 4 * lines_chunk lines, lanes of 4 chunks
+    monkeypatch.setitem(CONFIG["laserhead"], "max_chunk_factor", 4)
+    monkeypatch.setitem(CONFIG["laserhead"], "fifo_poll_ms", 0)
+    lines_chunk = head.cfg.hdl_cfg.lines_chunk
+    chunk = 4 * lines_chunk * line_bytes(head)
+    make_job(head, "job.pat", lanes=2, facets=16 * lines_chunk)
+    # FIFO level polled before every chunk
+    levels = [
+        "empty",  # start of a lane, not an underrun
+        "empty",
+        "empty",
+        "full",
+        "full",
+        "full",
+        None,
+        "empty",
+    ]
+    stop_line = head.blank_line()
+    read_state = head._read_fpga_state
+
+    async def fpga_state(data=None):
+        state = dict(await read_state(data))
+        sent = sum(len(command) for command, _ in head.sent if command != stop_line)
+        level = levels[sent // chunk] if sent // chunk < len(levels) else None
+        state["mem_empty"] = level == "empty"
+        state["mem_full"] = level == "full"
+        return state
+
+    head._read_fpga_state = fpga_state
+    # a clock advancing 100 us per transaction
+    clock = [0]
+    send = head.send_command
+
+    async def timed_send(command, timeout=0):
+        clock[0] += 100
+        await send(command, timeout)
+
+    head.send_command = timed_send
+    monkeypatch.setattr(base, "ticks_us", lambda: clock[0])
+    asyncio.run(head.print_loop("job.pat"))
+    sizes = [
+        len(command) // (lines_chunk * line_bytes(head))
+        for command, _ in head.sent
+        if command != stop_line
+    ]
+    # an empty FIFO doubles the lines per transaction up to a chunk, a
+    # full one halves them down to lines_chunk
+    assert sizes == [2, 2, 4, 4, 2, 2] + [1] * 12 + [2, 2]
+    job = head.state["job"]
+    assert job["underruns"] == 3
+    assert job["underrun_lanes"] == [0, 1]
+    # the FIFO is blocked from the full poll until it accepts a transaction
+    assert head.metrics.counters["fifo_blocked_us"] == 3 * 100
+
+
+def test_scan_gives_way(head):
+    lines = make_v1_job(head, "old.pat")
+    size = line_bytes(head)
+    blank = head.blank_line(int(head.cfg.laser_timing["scanline_length"]))
+    ticks = []
+
+    async def ticker(scan):
+        while not scan.done():
+            ticks.append(None)
+            await asyncio.sleep(0)
+
+    async def main():
+        with open(head.get_job_path("old.pat"), "rb") as f:  # noqa: ASYNC230
+            job = LaserJob(f)
+            scan = asyncio.ensure_future(
+                head.job_extents(job, "old.pat", len(blank), size)
+            )
+            await ticker(scan)
+            return scan.result()
+
+    assert asyncio.run(main()) == [(0, 0), (0, lines)]
+    assert len(ticks) > 1
+
+
+def test_scan_once(head, tmp_path, monkeypatch):
+    lines = make_v1_job(head, "job_e1_nocor.pat")
+    scans = []
+    scan = LaserJob.scan
+
+    def counted(job, *args):
+        scans.append(None)
+        return scan(job, *args)
+
+    monkeypatch.setattr(LaserJob, "scan", counted)
+    # the upload scans the job and keeps the extents in its metadata
+    uploaded = jobinfo.PatScanner("job_e1_nocor.pat")
+    uploaded.feed((tmp_path / "job_e1_nocor.pat").read_bytes())
+    extents = asyncio.run(head.scan_extents("job_e1_nocor.pat"))
+    meta = uploaded.result(head.cfg, False, extents)
+    assert meta["extents"] == [[0, 0], [0, lines]]
+    assert meta["lines"] == lines
+    jobinfo.save(str(tmp_path), "job_e1_nocor.pat", meta)
+    # exposures reuse them, the blank lane is skipped
+    for _ in range(2):
+        head.sent.clear()
+        asyncio.run(head.print_loop("job_e1_nocor.pat"))
+        data = [command for command, _ in head.sent if command != head.blank_line()]
+        assert sum(map(len, data)) == lines * line_bytes(head)
+    assert len(scans) == 1
+
+
+def host_encoding(head, repetition):
+    """Encodes the repetitions and direction of a line in its first bytes."""
+    cmd_len = Spi.command_bytes + Spi.word_bytes
+    size = line_bytes(head)
+
+    def encode(laser_bits, steps_line, direction, repetitions=1):
+        return [repetitions, direction + 1] + [0] * (size - 2)
+
+    def bit_to_byte_list(laser_bits, steps_line, direction):
+        return encode(laser_bits, steps_line, direction)
+
+    head.bit_to_byte_list = encode if repetition else bit_to_byte_list
+    head.byte_to_cmd_list = lambda data: [
+        bytes(data[idx : idx + cmd_len]) for idx in range(0, len(data), cmd_len)
+    ]
+
+
+def test_line_repetition(head, monkeypatch):
+    monkeypatch.setitem(CONFIG["defaultprint"], "exposureperline", 4)
+    make_job(head, "job.pat", lanes=2)
+    size = line_bytes(head)
+    sent = {}
+    for repetition in (False, True):
+        host_encoding(head, repetition)
+        head._line_repetition = None
+        head._blank_lines.clear()
+        head.sent.clear()
+        asyncio.run(head.print_loop("job.pat"))
+        assert head.line_repetition is repetition
+        stop_line = head.blank_line()
+        data = b"".join(command for command, _ in head.sent if command != stop_line)
+        sent[repetition] = [data[idx : idx + size] for idx in range(0, len(data), size)]
+    # with repetition every line is sent once instead of once per exposure
+    assert len(sent[False]) == 4 * len(sent[True]) > 0
+    for idx, line in enumerate(sent[True]):
+        assert line[0] == 4
+        for exposure in sent[False][4 * idx : 4 * idx + 4]:
+            assert exposure[0] == 1
+            assert exposure[1:] == line[1:]
+    # the config overrides the signature of the host
+    monkeypatch.setitem(CONFIG["laserhead"], "line_repetition", False)
+    head._line_repetition = None
+    assert head.line_repetition is False
+    # other errors of the host are not mistaken for a missing argument
+    monkeypatch.setitem(CONFIG["laserhead"], "line_repetition", None)
+    monkeypatch.setattr(base, "signature", None)
+
+    def broken(laser_bits, steps_line, direction, repetitions=1):
+        raise TypeError("unsupported operand")
+
+    head.bit_to_byte_list = broken
+    head._line_repetition = None
+    with pytest.raises(TypeError):
+        assert head.line_repetition
+    host_encoding(head, False)
+    assert head.line_repetition is False
+
+
+def test_spin_up(head, monkeypatch):
+    monkeypatch.setitem(CONFIG["laserhead"], "spinup_poll_ms", 1)
+    monkeypatch.setitem(CONFIG["laserhead"], "spinup_timeout_ms", 1000)
+    readings = [None, 10.0, 7.0, 6.0, 5.5, 5.01, 5.0, 5.0, 5.0, 5.0]
+
+    async def facet_period():
+        return readings.pop(0)
+
+    head.facet_period = facet_period
+    # the period has to settle, pulses of the photodiode do not suffice
+    assert asyncio.run(head.wait_spin_up()) < 1000
+    assert readings == [5.0]
+    # without a measured period the former fixed wait is kept
+    monkeypatch.setitem(CONFIG["laserhead"], "spinup_timeout_ms", 50)
+    readings = [None] * 1000
+    assert asyncio.run(head.wait_spin_up()) >= 50
+
+
+def test_blocking_moves(head, tmp_path):
+    (tmp_path / "square.gcode").write_text(
+        "G90\nG1 X5 F600\nG1 X5 Y5\nG1 X10 Y10\nG1 X15 Y15\n"
+    )
+    moves = {}
+
+    async def queue_move(move):
+        moves[head.queued_moves].append((move.entry, move.exit))
+
+    head.queue_move = queue_move
+    for queued in (True, False):
+        head.queued_moves = queued
+        moves[queued] = []
+        asyncio.run(head.execute_gcode("square.gcode"))
+    # the planner keeps up speed through corners when moves queue up
+    assert any(exit for _, exit in moves[True])
+    # a host that finishes every move before the next one stops at each
+    assert len(moves[False]) == len(moves[True])
+    assert all(entry == exit == 0 for entry, exit in moves[False])
+
+
+def test_gcode_soft_limits(head, tmp_path, monkeypatch):
+    (tmp_path / "job.gcode").write_text("M3 S100\nG1 X5 F600\nG1 X50 Y1\nM5\n")
+    monkeypatch.setitem(CONFIG["motors"]["x"], "max_mm", 20.0)
+    commands = []
+
+    async def queue_move(move):
+        commands.append(("move", move.target))
+
+    async def set_spindle(value):
+        commands.append(("spindle", value))
+
+    passes = []
+
+    class Optimizer(gcodefile.Optimizer):
+        def __init__(self, *args):
+            passes.append(None)
+            super().__init__(*args)
+
+    head.queue_move = queue_move
+    head.set_spindle = set_spindle
+    monkeypatch.setattr(gcodefile, "Optimizer", Optimizer)
+    # the limits are read with the motor settings
+    asyncio.run(head.execute_gcode("job.gcode"))
+    assert ("spindle", 100) in commands
+    commands.clear()
+    head.apply_motor_settings()
+    # the job is rejected before any move or spindle command
+    asyncio.run(head.execute_gcode("job.gcode"))
+    assert commands == [("spindle", 0)]
+    assert "X range" in head.state["error_message"]
+    # a rejected job is only planned, an executed one streams the optimized
+    # moves from the move list instead of writing them to the SD card
+    assert len(passes) == 3
+    assert os.listdir(tmp_path / gcodefile.META_FOLDER) == ["job.gcode.bin"]
+
+
+def test_settings_soft_limits(monkeypatch):
+    from control import webapp
+    from microdot.test_client import TestClient
+
+    motors = copy.deepcopy(CONFIG["motors"])
+    monkeypatch.setitem(CONFIG, "motors", motors)
+    monkeypatch.setattr(webapp, "is_authorized", lambda session: True)
+    monkeypatch.setattr(webapp, "update_config", lambda: None)
+    motors["x"]["max_mm"] = 123.0
+
+    async def save():
+        client = TestClient(webapp.app)
+        return await client.post("/api/settings", body={"motors": motors})
+
+    # the settings of the web UI refresh the cached limits
+    assert asyncio.run(save()).status_code == 200
+    assert webapp.laserhead.soft_limits()[1][0] == 123.0
+    monkeypatch.undo()
+    webapp.laserhead.apply_motor_settings()
+
+
+def test_gcode_stop(head, tmp_path):
+    lines = [f"G1 X{idx % 2} Y{idx} F600" for idx in range(40)]
+    (tmp_path / "job.gcode").write_text("\n".join(lines))
+    stopped = []
+
+    async def queue_move(move):
+        stopped.append(head._stop.is_set())
+        if len(stopped) == 5:
+            await head.emergency_stop()
+
+    head.queue_move = queue_move
+    asyncio.run(head.execute_gcode("job.gcode"))
+    # the moves in the look-ahead are discarded, not executed
+    assert stopped == [False] * 5
+
+
+def test_position_journal(head, monkeypatch):
+    monkeypatch.setitem(CONFIG["laserhead"], "position_commit_ms", 30)
+    monkeypatch.setitem(CONFIG["laserhead"], "progress_interval_ms", 0)
+    # a clock advancing a millisecond per reading
+    clock = [0]
+
+    def ticks_ms():
+        clock[0] += 1
+        return clock[0]
+
+    monkeypatch.setattr(base, "ticks_ms", ticks_ms)
+    head._journal_ticks = 0
+    commits = []
+    save_state = NVS_STORE.save_state
+
+    def record(mpos, woff):
+        commits.append((clock[0], head.state["printing"], list(mpos)))
+        save_state(mpos, woff)
+
+    monkeypatch.setattr(NVS_STORE, "save_state", record)
+    make_job(head, "job.pat", lanes=8)
+    asyncio.run(head.print_loop("job.pat"))
+    # while printing the journal is committed at most once per interval
+    during = [ticks for ticks, printing, _ in commits[:-1] if printing]
+    assert len(during) > 1
+    assert all(b - a >= 30 for a, b in itertools.pairwise(during))
+    # and at the end of the job
+    assert commits[-1][2] == head.mpos
+    assert not head._journal_dirty
+
+    commits.clear()
+    send = head.send_command
+
+    async def estop_after(command, timeout=0):
+        await send(command, timeout)
+        if len(head.sent) == 6:
+            await head.emergency_stop()
+            stopped.append(head.mpos)
+
+    stopped = []
+    head.send_command = estop_after
+    head.sent.clear()
+    # the lock refuses the move back to the origin
+    with pytest.raises(ValueError, match="E-STOP"):
+        asyncio.run(head.print_loop("job.pat"))
+    # an E-STOP commits the reached position right away
+    assert stopped
+    assert stopped[0] in [mpos for _, _, mpos in commits]
+
+
+def test_standby(head, monkeypatch):
+    monkeypatch.setitem(CONFIG["laserhead"], "standby_s", 0.2)
+    make_job(head, "job.pat", lanes=1)
+    spinups = []
+
+    async def wait_spin_up():
+        spinups.append(None)
+        return 0
+
+    head.wait_spin_up = wait_spin_up
+
+    async def main():
+        await head.print_loop("job.pat")
+        assert head.state["components"]["standby"]
+        # a job within standby_s finds the scan head spinning and locked
+        await head.print_loop("job.pat")
+        assert len(spinups) == 1
+        await asyncio.sleep(0.3)
+        # the scan head stops once the time has elapsed
+        assert not head.state["components"]["standby"]
+        assert not (await head.fpga_state)["synchronized"]
+        await head.print_loop("job.pat")
+        assert len(spinups) == 2
+        await head.leave_standby()
+
+    asyncio.run(main())
+
+
+def test_buffers_and_gc(head, monkeypatch):
+    monkeypatch.setitem(CONFIG["laserhead"], "progress_interval_ms", 0)
+    make_job(head, "job.pat", lanes=2)
+    buffers = []
+    buffer = head.buffer
+
+    def record(key, size):
+        buf = buffer(key, size)
+        buffers.append((key, buf))
+        return buf
+
+    head.buffer = record
+    stop_line = head.blank_line()
+    send = head.send_command
+    forced = []
+
+    async def collect_while_streaming(command, timeout=0):
+        await send(command, timeout)
+        # a collection the print loop did not start itself
+        if bytes(command) != stop_line:
+            gc.collect()
+            forced.append(None)
+
+    head.send_command = collect_while_streaming
+    asyncio.run(head.print_loop("job.pat"))
+    first = list(buffers)
+    # collections right before a lane ends are reset with the lane buffers
+    assert forced
+    assert head.state["job"]["gc_streaming"] > 0
+    buffers.clear()
+    asyncio.run(head.print_loop("job.pat"))
+    # the second job streams through the buffers of the first one
+    assert [key for key, _ in buffers] == [key for key, _ in first]
+    assert all(a is b for (_, a), (_, b) in zip(buffers, first))
@@ -0,0 +1,31 @@
+import gc
+
+from control.laserhead.metrics import GcMonitor, Metrics
+
+
+def test_histogram_buckets():
+    metrics = Metrics()
+    for value in (0, 1, 3, 4, 1000):
+        metrics.observe("spi_us", value)
+    metrics.count("bytes_sent", 36)
+    metrics.count("bytes_sent", 36)
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {"bytes_sent": 72}
+    summary = snapshot["histograms"]["spi_us"]
+    assert summary["count"] == 5
+    assert summary["max"] == 1000
+    # buckets are keyed by their exclusive upper bound
+    assert summary["buckets"] == {"1": 1, "2": 1, "4": 1, "8": 1, "1024": 1}
+    metrics.reset()
+    assert metrics.snapshot()["histograms"] == {}
+
+
+def test_gc_monitor():
+    monitor = GcMonitor()
+    assert monitor.poll() == 0
+    gc.collect()
+    assert monitor.poll() >= 1
+    gc.collect()
+    # collections started by the print loop itself are not counted
+    monitor.reset()
+    assert monitor.poll() == 0
@@ -0,0 +1,118 @@
+import asyncio
+import io
+
+import pytest
+
+from control.laserhead.pipeline import ChunkPipeline
+
+SIZE = 4
+
+
+class Stream:
+    """Stream of a chunk, records reads and fails if asked to."""
+
+    def __init__(self, data, reads, error=None):
+        self._stream = io.BytesIO(data)
+        self._reads = reads
+        self._error = error
+
+    def readinto(self, buf):
+        if self._error is not None:
+            raise self._error
+        self._reads.append(None)
+        return self._stream.readinto(buf)
+
+
+def chunks(count, reads, error_at=None):
+    """Chunks of their index, the last one is short."""
+    for idx in range(count):
+        error = ValueError("corrupt") if idx == error_at else None
+        yield (
+            Stream(bytes([idx]) * (SIZE if idx < count - 1 else 2), reads, error),
+            SIZE,
+        )
+
+
+def test_wraparound():
+    reads = []
+
+    async def main():
+        pipeline = ChunkPipeline(SIZE)
+        pipeline.start(chunks(5, reads))
+        received = []
+        try:
+            for _ in range(5):
+                chunk = await pipeline.get()
+                received.append((bytes(chunk), chunk.obj))
+                pipeline.release()
+            with pytest.raises(EOFError):
+                await pipeline.get()
+        finally:
+            pipeline.close()
+        return pipeline, received
+
+    pipeline, received = asyncio.run(main())
+    assert [data for data, _ in received] == [
+        bytes([idx]) * SIZE for idx in range(4)
+    ] + [bytes([4]) * 2]
+    # the chunks alternate between the two ring buffers, no copies are made
+    rings = [buf for _, buf in received]
+    assert rings[0] is rings[2] is rings[4] is pipeline._ring[0]
+    assert rings[1] is rings[3] is pipeline._ring[1]
+
+
+def test_backpressure():
+    reads = []
+
+    async def main():
+        pipeline = ChunkPipeline(SIZE, depth=2)
+        pipeline.start(chunks(5, reads))
+        for _ in range(10):
+            await asyncio.sleep(0)
+        # the producer waits while the ring is full
+        filled = len(reads)
+        chunk = await pipeline.get()
+        assert bytes(chunk) == bytes([0]) * SIZE
+        pipeline.release()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        pipeline.close()
+        return filled, len(reads)
+
+    assert asyncio.run(main()) == (2, 3)
+
+
+def test_error():
+    reads = []
+
+    async def main():
+        pipeline = ChunkPipeline(SIZE)
+        pipeline.start(chunks(5, reads, error_at=2))
+        received = []
+        try:
+            # chunks inflated before the failure are still delivered
+            with pytest.raises(ValueError, match="corrupt"):
+                while True:
+                    received.append(bytes(await pipeline.get()))
+                    pipeline.release()
+        finally:
+            pipeline.close()
+        return received
+
+    assert asyncio.run(main()) == [bytes([0]) * SIZE, bytes([1]) * SIZE]
+
+
+def test_close():
+    reads = []
+
+    async def main():
+        pipeline = ChunkPipeline(SIZE)
+        pipeline.start(chunks(5, reads))
+        task = pipeline._task
+        await pipeline.get()
+        # a consumer stopping early cancels the waiting producer
+        pipeline.close()
+        await asyncio.sleep(0)
+        return task
+
+    assert asyncio.run(main()).cancelled()
@@ -0,0 +1,52 @@
+import pytest
+
+from control.laserhead.planner import Planner, move_time
+
+ACCEL = [100.0, 100.0, 10.0]
+
+
+def test_move_time():
+    # 1 s accelerating and decelerating over 50 mm each, 1 s cruising
+    assert move_time(200, 0, 100, 0, 100) == pytest.approx(3.0)
+    # too short to reach the speed, peaks at 10 mm/s
+    assert move_time(1, 0, 100, 0, 100) == pytest.approx(0.2)
+    assert move_time(10, 10, 10, 10, 100) == pytest.approx(1.0)
+
+
+def test_junctions():
+    planner = Planner(ACCEL, 0.05, depth=2, position=[0, 0, 0])
+    assert planner.add([10, 0, 0], 10) == []
+    assert planner.add([20, 0, 0], 10) == []
+    # a straight junction keeps the speed, the last move ends at rest
+    first = planner.add([20, 10, 0], 10)[0]
+    assert first.entry == 0
+    assert first.exit == pytest.approx(10)
+    # the corner slows down, the reversal stops
+    second = planner.add([20, 0, 0], 10)[0]
+    assert 0 < second.exit < 10
+    moves = planner.flush()
+    assert moves[0].exit == 0
+    assert moves[-1].exit == 0
+    assert planner.add([20, 0, 0], 10) == []
+
+
+def test_axis_acceleration():
+    planner = Planner(ACCEL, 0.05, depth=1, position=[0, 0, 0])
+    planner.add([0, 0, 1], 10)
+    move = planner.flush()[0]
+    # z accelerates at 10 mm/s² over half of the move and decelerates over the rest
+    assert move.accel == 10
+    assert move.duration == pytest.approx(2 * (0.5 * 2 / 10) ** 0.5)
+
+
+def test_discard():
+    planner = Planner(ACCEL, 0.05, depth=2, position=[0, 0, 0])
+    planner.add([10, 0, 0], 10)
+    planner.add([20, 0, 0], 10)
+    released = planner.add([30, 0, 0], 10)
+    planner.discard()
+    # the queued moves are dropped, moves continue from the released one
+    assert planner.flush() == []
+    assert planner.position == released[-1].target
+    planner.add([0, 0, 0], 10)
+    assert planner.flush()[0].length == 10
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+from control.laserhead import twin
+from control.laserhead.twin import FPGATwin
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(twin, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def fpga(clock):
+    # a line takes 0.25 s and holds 2 words
+    cfg = SimpleNamespace(
+        laser_timing={"rpm": 60, "facets": 4},
+        hdl_cfg=SimpleNamespace(words_scanline=2),
+    )
+    fpga = FPGATwin(cfg, spi_hz=1e9, fifo_words=8)
+    fpga.parsing = fpga.synchronized = True
+    return fpga
+
+
+def test_back_pressure(fpga, clock):
+    line = 2 * fpga.word_bytes
+    assert fpga.write(4 * line) < 0.001
+    assert fpga.state()["mem_full"]
+    # two more lines have to wait for two lines to be exposed
+    assert fpga.write(2 * line) == pytest.approx(0.5)
+    clock[0] += 1.0
+    state = fpga.state()
+    assert not state["mem_full"]
+    assert fpga.lines_exposed == pytest.approx(4)
+    clock[0] += 1.0
+    assert fpga.state()["mem_empty"]
+    assert fpga.drained == 1
+
+
+def test_stalled_fifo(fpga):
+    fpga.synchronized = False
+    fpga.write(6 * fpga.word_bytes)
+    assert fpga.drain_time() is None
+    assert not fpga.state()["mem_empty"]
+
+
+def test_move_waits_for_lines(fpga, clock):
+    fpga.write(2 * fpga.word_bytes)
+    # 0.25 s to expose the line, 1 s for 20 mm
+    assert fpga.move([20.0, 0.0, 0.0]) == pytest.approx(1.25)
+    clock[0] += 0.75
+    assert fpga.stepper_position() == pytest.approx([10.0, 0.0, 0.0])
+    clock[0] += 0.5
+    assert fpga.stepper_position() == [20.0, 0.0, 0.0]
+
+
+def test_queued_moves(fpga, clock):
+    fpga.move_slots = 2
+    assert fpga.queue_move([10.0, 0.0, 0.0], 1.0) == 0
+    # the second move waits for a free slot, the third for the first move
+    assert fpga.queue_move([20.0, 0.0, 0.0], 1.0) == 0
+    assert fpga.queue_move([30.0, 0.0, 0.0], 1.0) == pytest.approx(1.0)
+    clock[0] += 1.5
+    assert fpga.stepper_position() == pytest.approx([15.0, 0.0, 0.0])
+    assert fpga.drain_time() == pytest.approx(1.5)